@@ -6,5 +6,8 @@ Modules:
 - cleaning: fuzzy entity standardisation for remitters/beneficiaries
 - network: network-effect metrics from Transfers
 - viz: lightweight plotting helpers using matplotlib (optional networkx)
+- sketches: mergeable KLL quantile sketches for streamed/partitioned thresholds
+- outofcore: optional DuckDB backend for the flow/counterparty aggregations over Parquet
+- instrumentation: opt-in timing/memory profiling of the functions above
 """
-__all__ = ["data_io", "cleaning", "network", "viz"]
+__all__ = ["data_io", "cleaning", "network", "viz", "sketches", "outofcore", "instrumentation"]
@@ -0,0 +1,148 @@
+"""
+Benchmark: vectorised participant_metrics / role labelling vs the previous
+row-wise implementation, on synthetic flow pairs.
+
+Run from the project folder:
+    python benchmarks/participant_metrics.py --pairs 10000000
+
+The legacy code below is the pre-vectorisation logic (Python set of
+corridor tuples, DataFrame.apply profiles, Series.apply quantile labels and
+a per-row role list); outputs are checked to be identical before timing is
+reported. At 10M pairs the legacy path needs a few GB of RAM.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import network  # noqa: E402
+
+
+def synthetic_flow_pairs(n_pairs, n_participants=None, seed=0):
+    """
+    Distinct (source_id, destination_id) pairs with heavy-tailed participant
+    activity, in build_flow_pairs' output format.
+    """
+    rng = np.random.default_rng(seed)
+    n_participants = n_participants or max(1000, int(n_pairs ** 0.5) * 4)
+    p = rng.pareto(1.1, n_participants) + 1
+    p /= p.sum()
+    pairs = pd.DataFrame({"source_id": [], "destination_id": []}, dtype=np.int64)
+    while len(pairs) < n_pairs:
+        draw = int((n_pairs - len(pairs)) * 1.5) + 1000
+        batch = pd.DataFrame({
+            "source_id": rng.choice(n_participants, draw, p=p).astype(np.int64) + 10_000,
+            "destination_id": rng.choice(n_participants, draw, p=p).astype(np.int64) + 10_000,
+        })
+        pairs = pd.concat([pairs, batch]).drop_duplicates()
+    pairs = pairs.head(n_pairs).copy()
+    pairs["transfer_count"] = rng.integers(1, 50, len(pairs))
+    pairs["total_value"] = rng.lognormal(9, 2, len(pairs))
+    return pairs.sort_values(["source_id", "destination_id"]).reset_index(drop=True)
+
+
+def legacy_participant_metrics(flow_pairs):
+    fp = flow_pairs.copy()
+    unique_dest = fp.groupby('source_id')['destination_id'].nunique().rename('unique_destinations')
+    unique_src  = fp.groupby('destination_id')['source_id'].nunique().rename('unique_sources')
+    sent = fp.groupby('source_id')['total_value'].sum().rename('total_sent')
+    received = fp.groupby('destination_id')['total_value'].sum().rename('total_received')
+    participants = pd.concat([unique_dest, unique_src, sent, received], axis=1).fillna(0.0)
+    participants.index.name = 'participant_id'
+    participants['unique_counterparties'] = participants['unique_destinations'] + participants['unique_sources']
+
+    corridors = set(tuple(x) for x in fp[['source_id','destination_id']].itertuples(index=False, name=None))
+    two_way = set()
+    for s, d in corridors:
+        if (d, s) in corridors:
+            two_way.add(s); two_way.add(d)
+    participants['has_two_way_flow'] = participants.index.map(lambda x: x in two_way)
+
+    def _profile(row):
+        if row['unique_counterparties'] == 0:
+            return 'Isolated'
+        if row['unique_destinations'] >= 5 and row['unique_sources'] >= 5:
+            return 'Hub'
+        if (row['unique_destinations'] >= 5 and row['unique_sources'] < 5) or \
+           (row['unique_sources'] >= 5 and row['unique_destinations'] < 5):
+            return 'Broker'
+        if row['unique_counterparties'] <= 2:
+            return 'Peripheral Member'
+        return 'Regular Member'
+
+    participants['interaction_profile'] = participants.apply(_profile, axis=1)
+    return participants.reset_index()
+
+
+def legacy_roles(degree, strength, betweenness):
+    def quantile_label(series, q_hi=0.9, q_mid=0.6):
+        hi = series.quantile(q_hi)
+        mid = series.quantile(q_mid)
+        return series.apply(lambda v: "High" if v >= hi else ("Medium" if v >= mid else "Low"))
+
+    deg_label, str_label, bet_label = quantile_label(degree), quantile_label(strength), quantile_label(betweenness)
+
+    def role_row(i):
+        d, s, b = deg_label.iloc[i], str_label.iloc[i], bet_label.iloc[i]
+        if d == "High" and s == "High":
+            return "Hub"
+        if b == "High":
+            return "Bridge"
+        if d == "Medium" or s == "Medium":
+            return "Connector"
+        return "Peripheral"
+
+    return [role_row(i) for i in range(len(degree))]
+
+
+def vectorised_roles(degree, strength, betweenness):
+    label = network._quantile_label
+    return list(network._network_roles(label(degree), label(strength), label(betweenness)))
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pairs", type=int, default=10_000_000)
+    parser.add_argument("--nodes", type=int, default=1_000_000, help="rows for the role-label benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-legacy", action="store_true", help="time the vectorised path only")
+    args = parser.parse_args(argv)
+
+    fp, t_gen = timed(synthetic_flow_pairs, args.pairs, None, args.seed)
+    print(f"flow pairs: {len(fp):,} ({t_gen:.1f}s to generate)")
+
+    new_pm, t_new_pm = timed(network.participant_metrics, fp)
+
+    rng = np.random.default_rng(args.seed)
+    degree = pd.Series(rng.zipf(2.0, args.nodes))
+    strength = pd.Series(rng.lognormal(12, 2, args.nodes))
+    betweenness = pd.Series(rng.pareto(1.5, args.nodes))
+    new_roles, t_new_roles = timed(vectorised_roles, degree, strength, betweenness)
+
+    rows = [("participant_metrics", t_new_pm), (f"role labels ({args.nodes:,} nodes)", t_new_roles)]
+    if args.skip_legacy:
+        for name, t in rows:
+            print(f"{name:32s} vectorised {t:8.2f}s")
+        return
+
+    old_pm, t_old_pm = timed(legacy_participant_metrics, fp)
+    old_roles, t_old_roles = timed(legacy_roles, degree, strength, betweenness)
+    assert new_pm.equals(old_pm), "participant_metrics output changed"
+    assert new_roles == old_roles, "role labels changed"
+
+    for (name, t_new), t_old in zip(rows, [t_old_pm, t_old_roles]):
+        print(f"{name:32s} legacy {t_old:8.2f}s  vectorised {t_new:8.2f}s  speed-up x{t_old / t_new:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmark harness: times and memory-profiles the main pipeline functions on
+synthetic data (benchmarks/synthetic.py) and writes the results as JSON.
+
+Run from the project folder:
+    python benchmarks/run.py --scales 1e3,1e4,1e5
+    python benchmarks/run.py --scales 1e6 --only build_flow_pairs,participant_metrics
+
+Each scale is the number of transfers; the other tables scale with it (see
+synthetic.generate). Every function is timed on its own (best of --repeat
+runs), then run once more under tracemalloc for the peak of Python
+allocations (numpy/pandas buffers included). The JSON holds one record per
+(scale, function) with rows in/out, seconds and peak MB, plus the library
+versions and git commit, so files from different runs can be compared.
+"""
+import os
+import sys
+import json
+import contextlib
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib  # noqa: E402
+matplotlib.use("Agg")
+
+import cleaning  # noqa: E402
+import network  # noqa: E402
+import viz  # noqa: E402
+from benchmarks.synthetic import generate  # noqa: E402
+
+
+def _rows(obj):
+    if isinstance(obj, tuple):
+        return _rows(obj[0])
+    if isinstance(obj, pd.DataFrame):
+        return len(obj)
+    return None
+
+
+def _once(fn):
+    """
+    `fn` memoised, so an input shared by several cases is built at most once
+    and only when a selected case asks for it.
+    """
+    cache = []
+
+    def get():
+        if not cache:
+            cache.append(fn())
+        return cache[0]
+    return get
+
+
+def _cases(dfs, args, plot_dir=None):
+    """
+    (name, callable, rows_in thunk) per benchmarked function. Inputs that
+    depend on an earlier step are built lazily, outside the timings, so
+    --only skips the setup of the cases it leaves out.
+    """
+    deposits, transfers = dfs["deposits"], dfs["transfers"]
+    flow_pairs = _once(lambda: network.build_flow_pairs(transfers))
+    client_network = _once(lambda: network.build_client_network(
+        dfs["client"], dfs["accounts"], transfers,
+        backend=args.backend, betweenness=args.betweenness, seed=args.seed))
+    remitters = _once(lambda: network.build_counterparty_metrics(
+        cleaning.standardise_counterparty_names(deposits, "deposit_remitter_name",
+                                                threshold=args.threshold, scorer=args.scorer),
+        "deposit_remitter_name_standardised", "normalised_amount", "remitter"))
+
+    def plot():
+        nodes_df, _, G = client_network()
+        return viz.plot_network(G, nodes_df, os.path.join(plot_dir, "network"), max_nodes=args.max_nodes)
+
+    return [
+        ("standardise_counterparty_names",
+         lambda: cleaning.standardise_counterparty_names(deposits, "deposit_remitter_name",
+                                                         threshold=args.threshold, scorer=args.scorer),
+         lambda: len(deposits)),
+        ("build_flow_pairs", lambda: network.build_flow_pairs(transfers), lambda: len(transfers)),
+        ("participant_metrics", lambda: network.participant_metrics(flow_pairs()),
+         lambda: len(flow_pairs())),
+        ("build_client_network",
+         lambda: network.build_client_network(dfs["client"], dfs["accounts"], transfers,
+                                              backend=args.backend, betweenness=args.betweenness,
+                                              seed=args.seed),
+         lambda: len(transfers)),
+        ("classify_quadrants", lambda: network.classify_quadrants(remitters()), lambda: len(remitters())),
+        ("plot_network", plot, lambda: len(client_network()[0])),
+    ]
+
+
+def measure(fn, repeat=1, memory=True):
+    """
+    Returns (result, best wall seconds, peak traced MB or None).
+    """
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1] / 1e6
+        finally:
+            tracemalloc.stop()
+    return out, best, peak
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile the pipeline on synthetic data.")
+    parser.add_argument("--scales", default="1e3,1e4,1e5", help="comma-separated transfer counts")
+    parser.add_argument("--only", default=None, help="comma-separated function names to run")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--scorer", default="difflib")
+    parser.add_argument("--backend", default="networkx")
+    parser.add_argument("--betweenness", default="auto")
+    parser.add_argument("--max-nodes", type=int, default=200)
+    parser.add_argument("--out", default=None, help="JSON path (default benchmarks/results/<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    only = set(args.only.split(",")) if args.only else None
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    out_path = args.out or os.path.join(ROOT, "benchmarks", "results", f"{stamp}.json")
+
+    records = []
+    with contextlib.ExitStack() as stack:
+        plot_dir = None
+        if not only or "plot_network" in only:
+            plot_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="fmfx_bench_"))
+        for scale in [int(float(s)) for s in args.scales.split(",")]:
+            dfs = generate(n_transfers=scale, seed=args.seed)
+            for name, fn, rows_in in _cases(dfs, args, plot_dir):
+                if only and name not in only:
+                    continue
+                rows_in = rows_in()
+                result, seconds, peak = measure(fn, repeat=args.repeat, memory=not args.no_memory)
+                rec = {
+                    "scale": scale,
+                    "function": name,
+                    "rows_in": rows_in,
+                    "rows_out": _rows(result),
+                    "seconds": round(seconds, 6),
+                    "peak_mb": None if peak is None else round(peak, 3),
+                }
+                if isinstance(result, pd.DataFrame) and "standardise_stats" in result.attrs:
+                    rec["comparisons"] = result.attrs["standardise_stats"].get("comparisons")
+                records.append(rec)
+                print(f"{scale:>12,}  {name:32s} {seconds:9.3f}s  "
+                      f"{'-' if peak is None else f'{peak:9.1f} MB'}")
+
+    payload = {
+        "timestamp": stamp,
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "versions": {"pandas": pd.__version__, "numpy": np.__version__},
+        "params": vars(args),
+        "results": records,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"Results written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
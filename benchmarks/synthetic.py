@@ -0,0 +1,280 @@
+"""
+Synthetic Client / Accounts / Deposits / Withdrawals / Transfers tables in
+the shape returned by data_io.load_all_tables, for benchmarking at scales
+well beyond the sample workbook.
+
+  - amounts are heavy-tailed (lognormal body with a Pareto tail) and
+    converted to GBP with fixed FX rates for normalised_amount
+  - account activity follows a power law, so a few accounts take part in
+    most transfers (hubs) and most accounts in a handful
+  - remitter / beneficiary names are drawn Zipf-style from a pool of
+    companies, with noisy spellings (case, punctuation, legal suffixes,
+    typos, spacing) for the fuzzy name standardisation
+
+    from benchmarks.synthetic import generate
+    dfs = generate(n_transfers=1_000_000, seed=0)
+
+For 1e7-1e8 rows use iter_transfers / iter_deposits / iter_withdrawals,
+which yield chunks that the streaming mode of build_flow_pairs and
+build_counterparty_metrics accepts directly.
+"""
+import numpy as np
+import pandas as pd
+
+CURRENCIES = np.array(["GBP", "EUR", "USD", "CHF", "JPY", "AED", "NGN"])
+CURRENCY_P = np.array([0.35, 0.30, 0.25, 0.03, 0.03, 0.02, 0.02])
+GBP_PER_UNIT = np.array([1.0, 0.85, 0.79, 0.89, 0.0053, 0.215, 0.00052])
+COUNTRIES = np.array(["GB", "LT", "DE", "US", "NG", "AE", "CH", "NZ", "FR", "NL"])
+VERTICALS = np.array(["FI", "MSB", "Crypto", "Corporate"])
+PODS = np.array(["MSB/PSP", "Crypto/CFD/Forex", "Corporate", "FI"])
+RISK = np.array(["Low", "Medium", "High"])
+
+_WORDS = ["Atlas", "Harbour", "Meridian", "Northgate", "Silver", "Crescent", "Pioneer", "Summit",
+          "Oak", "Beacon", "Falcon", "Granite", "Horizon", "Lumen", "Nova", "Orion", "Quay", "Sterling",
+          "Vertex", "Willow", "Apex", "Cobalt", "Delta", "Everest", "Kestrel", "Marble", "Regent"]
+_KINDS = ["Trading", "Payments", "Capital", "Logistics", "Holdings", "Partners", "Exchange", "Foods",
+          "Energy", "Consulting", "Textiles", "Shipping", "Markets", "Digital", "Services"]
+_SUFFIXES = ["Ltd", "Limited", "LLC", "GmbH", "SA", "BV", "Inc", "PLC", "UAB", "FZE"]
+
+
+def _rng(seed):
+    return seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+
+def power_law_weights(n, alpha=1.2, rng=None):
+    """
+    Selection probabilities with a Pareto(alpha) tail; smaller alpha = more skew.
+    """
+    w = _rng(rng).pareto(alpha, n) + 1.0
+    return w / w.sum()
+
+
+def heavy_tailed_amounts(n, rng=None, median=20_000.0, sigma=1.6, tail_share=0.02, tail_alpha=1.1):
+    """
+    Lognormal amounts with a share of Pareto-tail transactions on top.
+    """
+    rng = _rng(rng)
+    amounts = rng.lognormal(np.log(median), sigma, n)
+    tail = rng.random(n) < tail_share
+    amounts[tail] *= rng.pareto(tail_alpha, tail.sum()) + 1.0
+    return np.round(amounts, 2)
+
+
+def random_dates(n, rng=None, start="2025-01-01", days=240):
+    """
+    Timestamps spread over `days` days from `start`, during UK business hours.
+    """
+    rng = _rng(rng)
+    day = rng.integers(0, days, n).astype("timedelta64[D]")
+    ms = rng.integers(7 * 3_600_000, 23 * 3_600_000, n).astype("timedelta64[ms]")
+    return pd.to_datetime(np.datetime64(start, "ms") + day + ms)
+
+
+def company_names(n, rng=None):
+    """
+    n distinct base company names, e.g. "Harbour Payments Ltd 17".
+    """
+    rng = _rng(rng)
+    a = rng.choice(_WORDS, n)
+    b = rng.choice(_KINDS, n)
+    c = rng.choice(_SUFFIXES, n)
+    return [f"{x} {y} {z} {i}" for i, (x, y, z) in enumerate(zip(a, b, c))]
+
+
+def noisy_variant(name, rng=None):
+    """
+    One misspelling of `name`: case change, punctuation, dropped or swapped
+    legal suffix, a typo, or extra spacing.
+    """
+    rng = _rng(rng)
+    kind = rng.integers(0, 6)
+    if kind == 0:
+        return name.upper()
+    if kind == 1:
+        return name.lower()
+    if kind == 2:
+        parts = name.split()
+        return " ".join(p for p in parts if p not in _SUFFIXES) or name
+    if kind == 3:
+        return name.replace(" ", ", ", 1) + "."
+    if kind == 4 and len(name) > 4:
+        i = int(rng.integers(1, len(name) - 2))
+        if rng.random() < 0.5:
+            return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+        return name[:i] + name[i + 1:]
+    return "  " + name.replace(" ", "  ") + " "
+
+
+def name_pool(n_names, rng=None, max_variants=4, noise=0.3):
+    """
+    Returns (names, probabilities): every base name with its noisy variants.
+    Base names are Zipf-popular; each row uses a variant with prob. `noise`.
+    """
+    rng = _rng(rng)
+    bases = company_names(n_names, rng)
+    popularity = 1.0 / np.arange(1, n_names + 1) ** 1.05
+    rng.shuffle(popularity)
+    popularity /= popularity.sum()
+
+    names, probs = [], []
+    for base, p in zip(bases, popularity):
+        k = int(rng.integers(0, max_variants + 1))
+        variants = list(dict.fromkeys(noisy_variant(base, rng) for _ in range(k)))
+        names.append(base)
+        probs.append(p * (1 - noise if variants else 1.0))
+        for v in variants:
+            names.append(v)
+            probs.append(p * noise / len(variants))
+    probs = np.asarray(probs)
+    return np.asarray(names, dtype=object), probs / probs.sum()
+
+
+def make_clients(n_clients, rng=None, id_start=234_848_914_679):
+    rng = _rng(rng)
+    ids = id_start + np.arange(n_clients, dtype=np.int64) * 7
+    vertical = rng.choice(VERTICALS, n_clients)
+    country = rng.choice(COUNTRIES, n_clients)
+    return pd.DataFrame({
+        "hub_spot_deal_id": ids,
+        "group_name": [f"Group {i}" for i in rng.integers(1, max(2, n_clients // 3), n_clients)],
+        "group_country_incorp": country,
+        "company_name": [f"Company {i + 1}" for i in range(n_clients)],
+        "company_country_incorp": country,
+        "deal_stage": "Contract Signed",
+        "state": "Won",
+        "risk_rating": rng.choice(RISK, n_clients, p=[0.5, 0.35, 0.15]),
+        "pod": rng.choice(PODS, n_clients),
+        "vertical": vertical,
+        "segment": [f"{v} segment" for v in vertical],
+        "industry": [f"{v} - industry" for v in vertical],
+    })
+
+
+def make_accounts(clients, rng=None, mean_accounts=1.25, id_start=14_400):
+    """
+    One or more accounts per client (1 + Poisson(mean_accounts - 1)).
+    """
+    rng = _rng(rng)
+    per_client = 1 + rng.poisson(max(mean_accounts - 1, 0), len(clients))
+    n = int(per_client.sum())
+    return pd.DataFrame({
+        "account_id": id_start + np.arange(n, dtype=np.int64),
+        "status": rng.choice(["E", "C"], n, p=[0.95, 0.05]),
+        "hub_spot_deal_id": np.repeat(clients["hub_spot_deal_id"].to_numpy(), per_client),
+    })
+
+
+def _money(n, rng):
+    currency_idx = rng.choice(len(CURRENCIES), n, p=CURRENCY_P)
+    amount = heavy_tailed_amounts(n, rng)
+    normalised = np.round(amount * GBP_PER_UNIT[currency_idx], 6)
+    return CURRENCIES[currency_idx], amount, normalised
+
+
+def _chunks(n_rows, chunk_rows):
+    for lo in range(0, n_rows, chunk_rows):
+        yield lo, min(lo + chunk_rows, n_rows)
+
+
+def iter_transfers(accounts, n_rows, chunk_rows=1_000_000, seed=0, alpha=1.2, id_start=100_000, **date_kw):
+    """
+    Yields Transfers chunks; senders and recipients are drawn from power-law
+    account weights (sender and recipient activity are correlated).
+    """
+    rng = _rng(seed)
+    acc = accounts["account_id"].to_numpy()
+    client_of = accounts["hub_spot_deal_id"].to_numpy()
+    w = power_law_weights(len(acc), alpha, rng)
+    w_recv = 0.7 * w + 0.3 * power_law_weights(len(acc), alpha, rng)
+    for lo, hi in _chunks(n_rows, chunk_rows):
+        n = hi - lo
+        s = rng.choice(len(acc), n, p=w)
+        r = rng.choice(len(acc), n, p=w_recv)
+        currency, amount, normalised = _money(n, rng)
+        yield pd.DataFrame({
+            "transfer_id": id_start + np.arange(lo, hi, dtype=np.int64),
+            "london_created_date": random_dates(n, rng, **date_kw),
+            "sender_account_id": acc[s],
+            "recipient_account_id": acc[r],
+            "currency": currency,
+            "amount": amount,
+            "is_inter_entity_transfer": (client_of[s] == client_of[r]).astype(np.int64),
+            "normalised_amount": normalised,
+            "reciever_fee_normalised": np.round(normalised * rng.uniform(0.0005, 0.002, n), 6),
+            "sender_fee_normalised": np.zeros(n, dtype=np.int64),
+        })
+
+
+def _iter_external(accounts, n_rows, names, probs, chunk_rows, rng, alpha, id_start, kind, date_kw):
+    acc = accounts["account_id"].to_numpy()
+    w = power_law_weights(len(acc), alpha, rng)
+    for lo, hi in _chunks(n_rows, chunk_rows):
+        n = hi - lo
+        currency, amount, normalised = _money(n, rng)
+        frame = {
+            f"{kind}_id": id_start + np.arange(lo, hi, dtype=np.int64),
+            "account_id": acc[rng.choice(len(acc), n, p=w)],
+            "london_value_date": random_dates(n, rng, **date_kw),
+            "currency": currency,
+            "amount": amount,
+            "normalised_amount": normalised,
+        }
+        country = rng.choice(COUNTRIES, n)
+        fee = np.round(np.minimum(normalised * 0.001, 250.0) + rng.uniform(0, 15, n), 6)
+        name = names[rng.choice(len(names), n, p=probs)]
+        if kind == "deposit":
+            frame.update(deposit_origin=country, deposit_remitter_name=name, deposit_fee_normalised=fee)
+        else:
+            frame.update(beneficiary_bank_country=country, beneficiary_name=name, withdrawal_fee_normalised=fee)
+        yield pd.DataFrame(frame)
+
+
+def iter_deposits(accounts, n_rows, n_remitters=None, chunk_rows=1_000_000, seed=1, alpha=1.2,
+                  noise=0.3, id_start=200_000, **date_kw):
+    """
+    Yields Deposits chunks with noisy deposit_remitter_name values.
+    """
+    rng = _rng(seed)
+    names, probs = name_pool(n_remitters or max(20, n_rows // 50), rng, noise=noise)
+    yield from _iter_external(accounts, n_rows, names, probs, chunk_rows, rng, alpha, id_start, "deposit", date_kw)
+
+
+def iter_withdrawals(accounts, n_rows, n_beneficiaries=None, chunk_rows=1_000_000, seed=2, alpha=1.2,
+                     noise=0.3, id_start=300_000, **date_kw):
+    """
+    Yields Withdrawals chunks with noisy beneficiary_name values.
+    """
+    rng = _rng(seed)
+    names, probs = name_pool(n_beneficiaries or max(20, n_rows // 50), rng, noise=noise)
+    yield from _iter_external(accounts, n_rows, names, probs, chunk_rows, rng, alpha, id_start, "withdrawal", date_kw)
+
+
+def _concat(chunks):
+    return pd.concat(list(chunks), ignore_index=True)
+
+
+def generate(n_transfers=10_000, n_clients=None, n_deposits=None, n_withdrawals=None,
+             n_counterparties=None, seed=0, noise=0.3, alpha=1.2):
+    """
+    All five tables in memory, keyed as data_io.load_all_tables returns them.
+    Defaults scale with n_transfers roughly like the sample workbook
+    (about 1 client per 50 transfers, deposits ~1x and withdrawals ~2.5x
+    transfers, one counterparty per 50 deposit/withdrawal rows).
+    """
+    rng = np.random.default_rng(seed)
+    n_clients = n_clients or max(20, n_transfers // 50)
+    n_deposits = n_transfers if n_deposits is None else n_deposits
+    n_withdrawals = int(2.5 * n_transfers) if n_withdrawals is None else n_withdrawals
+
+    clients = make_clients(n_clients, rng)
+    accounts = make_accounts(clients, rng)
+    seeds = rng.integers(0, 2**32, 3)
+    return {
+        "client": clients,
+        "accounts": accounts,
+        "deposits": _concat(iter_deposits(accounts, n_deposits, n_counterparties, seed=int(seeds[0]),
+                                          alpha=alpha, noise=noise)),
+        "withdrawals": _concat(iter_withdrawals(accounts, n_withdrawals, n_counterparties, seed=int(seeds[1]),
+                                                alpha=alpha, noise=noise)),
+        "transfers": _concat(iter_transfers(accounts, n_transfers, seed=int(seeds[2]), alpha=alpha)),
+    }
@@ -0,0 +1,250 @@
+import os
+import json
+import hashlib
+import warnings
+import numpy as np
+import pandas as pd
+
+try:
+    from .instrumentation import instrumented
+except ImportError:
+    from instrumentation import instrumented
+
+SHEETS = ["Client", "Accounts", "Deposits", "Withdrawals", "Transfers"]
+
+# All sheets in the provided workbook have their headers in the 2nd row (index=1)
+HEADER_ROW = 1
+
+# Cells read as missing, as pd.read_excel does by default
+NA_STRINGS = {
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+}
+
+
+# Declared dtypes per table. "id32" = Int32, widened to Int64 if the values do
+# not fit; "amount" = float64, or float32 with float32_amounts=True.
+SCHEMAS = {
+    "client": {
+        "hub_spot_deal_id": "Int64",
+        "group_country_incorp": "category",
+        "company_country_incorp": "category",
+        "deal_stage": "category",
+        "state": "category",
+        "risk_rating": "category",
+        "pod": "category",
+        "vertical": "category",
+        "segment": "category",
+        "industry": "category",
+    },
+    "accounts": {
+        "account_id": "id32",
+        "status": "category",
+        "hub_spot_deal_id": "Int64",
+    },
+    "deposits": {
+        "deposit_id": "id32",
+        "account_id": "id32",
+        "london_value_date": "datetime",
+        "currency": "category",
+        "amount": "amount",
+        "normalised_amount": "amount",
+        "deposit_origin": "category",
+        "deposit_fee_normalised": "amount",
+    },
+    "withdrawals": {
+        "withdrawal_id": "id32",
+        "account_id": "id32",
+        "london_value_date": "datetime",
+        "currency": "category",
+        "amount": "amount",
+        "normalised_amount": "amount",
+        "beneficiary_bank_country": "category",
+        "withdrawal_fee_normalised": "amount",
+    },
+    "transfers": {
+        "transfer_id": "id32",
+        "london_created_date": "datetime",
+        "sender_account_id": "id32",
+        "recipient_account_id": "id32",
+        "currency": "category",
+        "amount": "amount",
+        "is_inter_entity_transfer": "Int8",
+        "normalised_amount": "amount",
+        "reciever_fee_normalised": "amount",
+        "sender_fee_normalised": "amount",
+    },
+}
+
+
+def _cell(v):
+    return None if isinstance(v, str) and v in NA_STRINGS else v
+
+
+def snake_columns(columns):
+    """
+    'HubSpotDealId' -> 'hub_spot_deal_id' (same convention as the notebook).
+    """
+    return (
+        pd.Index(columns)
+        .str.strip()
+        .str.replace("(?<=[a-z])(?=[A-Z])", "_", regex=True)
+        .str.lower()
+    )
+
+
+@instrumented
+def read_workbook(excel_path: str, sheets=SHEETS):
+    """
+    Opens the workbook once (openpyxl read-only, cached values) and streams
+    every requested sheet. Columns without a header and columns that are
+    entirely empty are dropped; the usual NA strings ("NULL", "N/A", ...)
+    become missing as with pd.read_excel.
+    Returns a dict keyed by lower-case sheet name.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        dfs = {}
+        for sheet in sheets:
+            rows = wb[sheet].iter_rows(values_only=True)
+            for _ in range(HEADER_ROW):
+                next(rows, None)
+            header = next(rows, ())
+            keep = [k for k, h in enumerate(header) if h is not None and str(h).strip()]
+            records = [[_cell(row[k]) if k < len(row) else None for k in keep] for row in rows]
+
+            df = pd.DataFrame.from_records(records, columns=[str(header[k]) for k in keep])
+            df = df.dropna(axis=0, how="all").reset_index(drop=True)
+            df = df.dropna(axis=1, how="all")
+            df.columns = snake_columns(df.columns)
+            dfs[sheet.lower()] = df
+    finally:
+        wb.close()
+    return dfs
+
+
+def _apply_dtype(col: pd.Series, kind: str, float32_amounts: bool):
+    if kind == "category":
+        return col.astype("category")
+    if kind == "datetime":
+        return pd.to_datetime(col, errors="coerce")
+    if kind == "amount":
+        return pd.to_numeric(col, errors="coerce").astype("float32" if float32_amounts else "float64")
+    num = pd.to_numeric(col, errors="coerce")
+    if kind == "id32":
+        info = np.iinfo(np.int32)
+        fits = num.dropna().between(info.min, info.max).all()
+        return num.astype("Int32" if fits else "Int64")
+    return num.astype(kind)
+
+
+def apply_schema(df: pd.DataFrame, schema: dict, float32_amounts: bool = False):
+    """
+    Casts the columns listed in `schema` (see SCHEMAS); others are left as is.
+    """
+    out = df.copy()
+    for col, kind in schema.items():
+        if col in out.columns:
+            out[col] = _apply_dtype(out[col], kind, float32_amounts)
+    return out
+
+
+@instrumented
+def compact_tables(dfs: dict, schemas: dict = SCHEMAS, float32_amounts: bool = False):
+    """
+    Applies the declared schema to every table that has one.
+    Returns (compacted dfs, report) where the report has one row per table
+    with its deep memory usage before and after, in MB.
+    """
+    out, rows = {}, []
+    for name, df in dfs.items():
+        out[name] = apply_schema(df, schemas[name], float32_amounts) if name in schemas else df
+        before = df.memory_usage(deep=True).sum() / 1e6
+        after = out[name].memory_usage(deep=True).sum() / 1e6
+        rows.append({
+            "table": name,
+            "rows": len(df),
+            "memory_before_mb": round(before, 3),
+            "memory_after_mb": round(after, 3),
+            "saving_pct": round(100 * (1 - after / before), 1) if before else 0.0,
+        })
+    return out, pd.DataFrame(rows)
+
+
+def iter_parquet_batches(path: str, columns=None, batch_size: int = 1_000_000):
+    """
+    Yields a Parquet file (or dataset directory) as DataFrame chunks of up
+    to batch_size rows, for the streaming mode of the network aggregations.
+    """
+    import pyarrow.dataset as ds
+
+    for batch in ds.dataset(path, format="parquet").to_batches(columns=columns, batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def _source_key(excel_path: str, use_hash: bool):
+    st = os.stat(excel_path)
+    key = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if use_hash:
+        h = hashlib.sha256()
+        with open(excel_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        key["sha256"] = h.hexdigest()
+    return key
+
+
+@instrumented
+def load_all_tables(excel_path: str, cache_dir: str = None, use_hash: bool = False, sheets=SHEETS,
+                    compact: bool = False, float32_amounts: bool = False):
+    """
+    Returns a dict with keys: client, accounts, deposits, withdrawals, transfers
+
+    compact=True applies SCHEMAS (nullable integer ids, categoricals, datetimes;
+    float32 amounts with float32_amounts=True). Use compact_tables directly
+    for the memory report.
+
+    With cache_dir set, the tables are written to Parquet on first load and
+    read back from there while the workbook is unchanged. The cache key is
+    the file size and mtime (plus a SHA-256 of the content with use_hash=True);
+    any change rebuilds the cache. Needs pyarrow (or fastparquet) for caching,
+    otherwise the workbook is read every time.
+    """
+    if compact:
+        dfs = load_all_tables(excel_path, cache_dir, use_hash, sheets)
+        return compact_tables(dfs, float32_amounts=float32_amounts)[0]
+
+    if cache_dir is None:
+        return read_workbook(excel_path, sheets)
+
+    stem = os.path.splitext(os.path.basename(excel_path))[0].replace(" ", "_")
+    manifest_path = os.path.join(cache_dir, f"{stem}.manifest.json")
+    paths = {s.lower(): os.path.join(cache_dir, f"{stem}__{s.lower()}.parquet") for s in sheets}
+    key = {"source": os.path.abspath(excel_path), **_source_key(excel_path, use_hash), "sheets": list(sheets)}
+
+    if os.path.exists(manifest_path) and all(os.path.exists(p) for p in paths.values()):
+        with open(manifest_path) as f:
+            if json.load(f) == key:
+                return {name: pd.read_parquet(p) for name, p in paths.items()}
+
+    dfs = read_workbook(excel_path, sheets)
+    # Missing engine, or a column Parquet cannot hold (e.g. mixed types in a
+    # hand-edited sheet): keep the tables in memory without a cache
+    errors = (ImportError, ValueError, TypeError)
+    try:
+        import pyarrow
+        errors += (pyarrow.ArrowException,)
+    except ImportError:
+        pass
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for name, df in dfs.items():
+            df.to_parquet(paths[name], index=False)
+    except errors as e:
+        warnings.warn(f"Parquet cache disabled ({e}); reading the workbook directly.")
+        return dfs
+    with open(manifest_path, "w") as f:
+        json.dump(key, f, indent=2)
+    return dfs
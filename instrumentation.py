@@ -0,0 +1,230 @@
+"""
+Lightweight profiling for the pipeline functions.
+
+The public functions of data_io, cleaning, network and viz are wrapped with
+@instrumented. When profiling is on, each call records wall time, peak
+traced memory, input/output row counts and, where the result carries
+them (cleaning's standardise_stats), the number of similarity comparisons.
+Sections inside a function can be timed with `with stage("name"):`.
+
+Switch it on with the FMFX_PROFILE=1 environment variable (FMFX_PROFILE_MEMORY=0
+skips tracemalloc), or for a block of code:
+
+    with instrumentation.profiling() as prof:
+        run_pipeline()
+    prof.to_frame()          # one row per call
+    prof.to_json("run.json")
+
+When profiling is off the wrappers only check a flag before calling through.
+"""
+import os
+import json
+import time
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+ENV_VAR = "FMFX_PROFILE"
+MEMORY_ENV_VAR = "FMFX_PROFILE_MEMORY"
+
+
+def _env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("", "0", "false", "no", "off")
+
+
+class Profile:
+    """
+    Records collected while profiling is on, in call-completion order.
+    Nested calls carry their parent's name and depth.
+    """
+
+    def __init__(self):
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def clear(self):
+        self.records.clear()
+
+    def to_frame(self):
+        columns = ["name", "parent", "depth", "seconds", "peak_mb", "rows_in", "rows_out", "comparisons", "stats"]
+        return pd.DataFrame(self.records, columns=columns)
+
+    def to_json(self, path=None):
+        """
+        Returns the records as a JSON string; also writes it to `path` if given.
+        """
+        text = json.dumps({"records": self.records}, indent=2, default=str)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+
+_STATE = {
+    "enabled": _env_flag(ENV_VAR, False),
+    "memory": _env_flag(MEMORY_ENV_VAR, True),
+    "profile": Profile(),
+    "stack": [],
+}
+
+
+def is_enabled():
+    return _STATE["enabled"]
+
+
+def enable(memory=True):
+    _STATE["enabled"] = True
+    _STATE["memory"] = memory
+
+
+def disable():
+    _STATE["enabled"] = False
+
+
+def current_profile():
+    """
+    The Profile receiving records (the global one outside profiling()).
+    """
+    return _STATE["profile"]
+
+
+@contextmanager
+def profiling(memory=True):
+    """
+    Turns profiling on for the block and yields a fresh Profile with the
+    records made inside it. The previous state is restored on exit.
+    """
+    saved = (_STATE["enabled"], _STATE["memory"], _STATE["profile"])
+    prof = Profile()
+    _STATE.update(enabled=True, memory=memory, profile=prof)
+    try:
+        yield prof
+    finally:
+        _STATE["enabled"], _STATE["memory"], _STATE["profile"] = saved
+
+
+def _rows(obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, tuple) and obj and isinstance(obj[0], (pd.DataFrame, pd.Series)):
+        return len(obj[0])
+    return None
+
+
+def _stats(result):
+    # "*_stats" dicts that the pipeline functions leave in DataFrame.attrs,
+    # or a trailing stats dict in a returned tuple (e.g. estimate_betweenness)
+    if isinstance(result, tuple) and result and isinstance(result[-1], dict):
+        return {"stats": result[-1]}
+    frame = result[0] if isinstance(result, tuple) and result else result
+    if not isinstance(frame, pd.DataFrame):
+        return {}
+    return {k: v for k, v in frame.attrs.items() if k.endswith("_stats") and isinstance(v, dict)}
+
+
+class _Frame:
+    __slots__ = ("name", "start", "base", "peak")
+
+    def __init__(self, name, base):
+        self.name = name
+        self.start = time.perf_counter()
+        self.base = base
+        self.peak = 0
+
+
+def _enter(name):
+    base = None
+    if _STATE["memory"]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _STATE["owns_tracing"] = True
+        current, peak = tracemalloc.get_traced_memory()
+        if _STATE["stack"]:
+            parent = _STATE["stack"][-1]
+            parent.peak = max(parent.peak, peak)
+        tracemalloc.reset_peak()
+        base = current
+    frame = _Frame(name, base)
+    _STATE["stack"].append(frame)
+    return frame
+
+
+def _exit(frame, rows_in=None, result=None):
+    seconds = time.perf_counter() - frame.start
+    stack = _STATE["stack"]
+    stack.pop()
+    peak_mb = None
+    if frame.base is not None and tracemalloc.is_tracing():
+        frame.peak = max(frame.peak, tracemalloc.get_traced_memory()[1])
+        peak_mb = round(max(frame.peak - frame.base, 0) / 1e6, 3)
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, frame.peak)
+        elif _STATE.pop("owns_tracing", False):
+            tracemalloc.stop()
+
+    stats = _stats(result)
+    comparisons = next((s["comparisons"] for s in stats.values() if "comparisons" in s), None)
+    _STATE["profile"].records.append({
+        "name": frame.name,
+        "parent": stack[-1].name if stack else None,
+        "depth": len(stack),
+        "seconds": round(seconds, 6),
+        "peak_mb": peak_mb,
+        "rows_in": rows_in,
+        "rows_out": _rows(result),
+        "comparisons": comparisons,
+        "stats": stats or None,
+    })
+
+
+def instrumented(fn):
+    """
+    Decorator recording one profile entry per call while profiling is on.
+    rows_in is the total length of the DataFrame / Series arguments.
+    """
+    name = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _STATE["enabled"]:
+            return fn(*args, **kwargs)
+        sizes = [len(a) for a in (*args, *kwargs.values()) if isinstance(a, (pd.DataFrame, pd.Series))]
+        frame = _enter(name)
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        finally:
+            _exit(frame, sum(sizes) if sizes else None, result)
+
+    return wrapper
+
+
+class stage:
+    """
+    Context manager recording a named section (e.g. "betweenness") as a
+    child of the enclosing instrumented call.
+    """
+    __slots__ = ("name", "frame")
+
+    def __init__(self, name):
+        self.name = name
+        self.frame = None
+
+    def __enter__(self):
+        if _STATE["enabled"]:
+            self.frame = _enter(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        if self.frame is not None:
+            _exit(self.frame)
+            self.frame = None
+        return False
@@ -1,96 +1,631 @@
-import re, math, warnings
+import os, re, math, warnings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
 import networkx as nx
+from scipy import sparse
 
+try:
+    from .instrumentation import instrumented, stage
+    from .sketches import KLLSketch, threshold
+    from . import outofcore
+except ImportError:
+    from instrumentation import instrumented, stage
+    from sketches import KLLSketch, threshold
+    import outofcore
 
 
+class SparseClientGraph:
+    """
+    Client-to-client network held as SciPy CSR matrices over a compact node
+    index (row/column k <-> node_ids[k]):
+      - adjacency: 1 per directed edge (sender -> recipient)
+      - weight:    summed edge_amount
+      - count:     summed edge_count
+    Metrics use sparse linear algebra; to_networkx() builds the equivalent
+    nx.DiGraph only when a consumer (e.g. viz.plot_network) needs one.
+    """
+
+    def __init__(self, node_ids, src_pos, dst_pos, weight, count):
+        self.node_ids = np.asarray(node_ids, dtype=np.int64)
+        self.index = pd.Index(self.node_ids)
+        # Edge list in edges_df order, kept for an exact networkx round trip
+        self.src_pos = np.asarray(src_pos, dtype=np.int64)
+        self.dst_pos = np.asarray(dst_pos, dtype=np.int64)
+        self.edge_weight = np.asarray(weight, dtype=float)
+        self.edge_count = np.asarray(count, dtype=np.int64)
+
+        n = len(self.node_ids)
+        shape = (n, n)
+        ij = (self.src_pos, self.dst_pos)
+        self.adjacency = sparse.csr_matrix((np.ones(len(self.src_pos), dtype=np.int64), ij), shape=shape)
+        self.weight = sparse.csr_matrix((self.edge_weight, ij), shape=shape)
+        self.count = sparse.csr_matrix((self.edge_count, ij), shape=shape)
+
+    @classmethod
+    def from_edges(cls, edges_df, node_ids):
+        """
+        Builds the graph from build_client_network's edges_df; node_ids sets
+        the node order (isolated clients included).
+        """
+        index = pd.Index(np.asarray(node_ids, dtype=np.int64))
+        src = index.get_indexer(edges_df["sender_client"].astype("int64").to_numpy())
+        dst = index.get_indexer(edges_df["recipient_client"].astype("int64").to_numpy())
+        return cls(index.to_numpy(), src, dst,
+                   edges_df["edge_amount"].to_numpy(), edges_df["edge_count"].to_numpy())
+
+    def number_of_nodes(self):
+        return len(self.node_ids)
+
+    def number_of_edges(self):
+        return len(self.src_pos)
+
+    def out_degree(self):
+        return np.diff(self.adjacency.indptr)
+
+    def in_degree(self):
+        return np.bincount(self.adjacency.indices, minlength=self.number_of_nodes())
+
+    def out_strength(self):
+        return np.asarray(self.weight.sum(axis=1)).ravel()
+
+    def in_strength(self):
+        return np.asarray(self.weight.sum(axis=0)).ravel()
+
+    def _mutual(self):
+        # Edges u -> v with v -> u also present (self-loops included)
+        return self.adjacency.multiply(self.adjacency.T).tocsr()
+
+    def reciprocity(self):
+        """
+        Share of directed edges whose reverse edge exists (self-loops
+        excluded), as nx.overall_reciprocity.
+        """
+        mutual = self._mutual()
+        loops = int(self.adjacency.diagonal().sum())
+        edges = self.number_of_edges()
+        return (mutual.nnz - loops) / edges if edges else 0.0
+
+    def node_reciprocity(self):
+        """
+        Per node 2 * |succ & pred| / (|succ| + |pred|), as nx.reciprocity;
+        NaN for isolated nodes.
+        """
+        mutual = np.diff(self._mutual().indptr)
+        total = self.out_degree() + self.in_degree()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(total > 0, 2.0 * mutual / total, np.nan)
+
+    def neighbours(self, node, direction="both"):
+        """
+        Client ids adjacent to `node`: "out" (recipients), "in" (senders) or "both".
+        """
+        k = self.index.get_loc(node)
+        out = self.adjacency.indices[self.adjacency.indptr[k]:self.adjacency.indptr[k + 1]]
+        if direction == "out":
+            pos = out
+        else:
+            col = self.adjacency[:, k].tocoo().row
+            pos = col if direction == "in" else np.union1d(out, col)
+        return self.node_ids[np.sort(pos)]
+
+    def neighbourhood_size(self, hops=1):
+        """
+        Number of other clients reachable within `hops` steps, ignoring direction.
+        """
+        und = ((self.adjacency + self.adjacency.T) > 0).astype(np.int64).tocsr()
+        reach = und.copy()
+        for _ in range(hops - 1):
+            reach = ((reach + reach @ und) > 0).astype(np.int64).tocsr()
+        reach.setdiag(0)
+        reach.eliminate_zeros()
+        return np.diff(reach.indptr)
+
+    def average_neighbour_strength(self):
+        """
+        Mean total strength (in + out) of each client's neighbours, ignoring
+        direction; 0 for isolated clients.
+        """
+        und = ((self.adjacency + self.adjacency.T) > 0).astype(float).tocsr()
+        strength = self.out_strength() + self.in_strength()
+        deg = np.diff(und.indptr)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(deg > 0, (und @ strength) / deg, 0.0)
+
+    def to_undirected_networkx(self):
+        """
+        Undirected nx.Graph with the same node and adjacency order as
+        to_networkx().to_undirected(), without edge attributes.
+        """
+        order = np.argsort(self.src_pos, kind="stable")
+        ug = nx.Graph()
+        ug.add_nodes_from(self.node_ids.tolist())
+        ug.add_edges_from(zip(self.node_ids[self.src_pos[order]].tolist(),
+                              self.node_ids[self.dst_pos[order]].tolist()))
+        return ug
+
+    def to_networkx(self):
+        """
+        The equivalent nx.DiGraph (edge attributes 'weight' and 'count').
+        """
+        G = nx.DiGraph()
+        G.add_edges_from(
+            (int(u), int(v), {"weight": float(w), "count": int(c)})
+            for u, v, w, c in zip(self.node_ids[self.src_pos], self.node_ids[self.dst_pos],
+                                  self.edge_weight, self.edge_count)
+        )
+        G.add_nodes_from(self.node_ids.tolist())
+        return G
+
+
+class AccountIndex:
+    """
+    Account -> client (hub_spot_deal_id) mapping held as a sorted int64
+    account_id array and, per account, a code into `client_ids` (-1 where
+    the account has no usable client id). Lookups are one np.searchsorted
+    over the whole column instead of a dict lookup per row.
+
+    Build it once per accounts snapshot and pass it wherever an accounts
+    table is taken (build_client_network, windowed_client_metrics,
+    NetworkState, build_flow_pairs(accounts=...)), or use attach() to add
+    the client id to deposits / withdrawals:
+
+        index = AccountIndex.from_accounts(accounts)
+        nodes_df, edges_df, G = build_client_network(clients, index, transfers)
+        client_pairs = build_flow_pairs(transfers, accounts=index)
+        deposits = index.attach(deposits)
+    """
+
+    def __init__(self, account_ids, client_ids):
+        account_ids = np.asarray(account_ids, dtype=np.int64)
+        client_ids = pd.array(client_ids, dtype="Int64")
+        if len(account_ids) != len(client_ids):
+            raise ValueError("account_ids and client_ids must have the same length")
+        # Last row wins for repeated accounts, as with dict(zip(...))
+        rev = account_ids[::-1]
+        self.account_ids, first = np.unique(rev, return_index=True)
+        codes, self.client_ids = pd.factorize(client_ids[::-1][first], use_na_sentinel=True)
+        self.client_ids = np.asarray(self.client_ids, dtype=np.int64)
+        self.codes = codes.astype(np.int64)
+
+    @classmethod
+    def from_accounts(cls, accounts: pd.DataFrame):
+        """
+        Index over an Accounts table (account_id, hub_spot_deal_id); rows
+        missing either id are skipped.
+        """
+        acc_map = accounts[["account_id", "hub_spot_deal_id"]].dropna()
+        client = pd.to_numeric(acc_map["hub_spot_deal_id"], errors="coerce").astype("Int64")
+        return cls(acc_map["account_id"].astype("int64").to_numpy(), client)
+
+    def __len__(self):
+        return len(self.account_ids)
+
+    def __repr__(self):
+        return f"AccountIndex(accounts={len(self)}, clients={len(self.client_ids)})"
+
+    def lookup(self, account_ids):
+        """
+        Client codes (positions in client_ids) for an array of account ids;
+        -1 for missing or unknown accounts.
+        """
+        values = account_ids if isinstance(account_ids, (pd.Series, pd.Index)) else np.asarray(account_ids)
+        if values.dtype == object:
+            values = pd.to_numeric(pd.Series(values), errors="coerce")
+        # Binary search over the distinct ids only: a column holds few of
+        # them, and searchsorted on millions of unordered keys is cache-bound
+        row_codes, uniques = pd.factorize(values)
+        ids = np.asarray(uniques).astype(np.int64)
+        found = np.full(len(ids) + 1, -1, dtype=np.int64)   # last slot for missing ids
+        if len(self.account_ids) and len(ids):
+            pos = np.searchsorted(self.account_ids, ids).clip(max=len(self.account_ids) - 1)
+            found[:-1] = np.where(self.account_ids[pos] == ids, self.codes[pos], -1)
+        return found[row_codes]
+
+    def map(self, account_ids):
+        """
+        hub_spot_deal_id per account id as a nullable Int64 array (<NA>
+        where the account does not map to a client).
+        """
+        codes = self.lookup(account_ids)
+        return pd.arrays.IntegerArray(self.client_ids[codes.clip(min=0)], codes < 0)
+
+    def attach(self, df: pd.DataFrame, account_col: str = "account_id", client_col: str = "hub_spot_deal_id"):
+        """
+        Copy of `df` (e.g. deposits or withdrawals) with `client_col` added
+        from its `account_col`, ready for a groupby to client level.
+        """
+        out = df.copy()
+        out[client_col] = self.map(df[account_col])
+        return out
+
+
+def account_index(accounts):
+    """
+    `accounts` as an AccountIndex (an existing index is returned as is).
+    """
+    return accounts if isinstance(accounts, AccountIndex) else AccountIndex.from_accounts(accounts)
+
+
+BETWEENNESS_ENGINES = ("auto", "exact", "sample", "adaptive")
+
+_BETWEENNESS_WORKER = {}
+
+
+def _undirected_adjacency(n, src_pos, dst_pos):
+    # Binary symmetric CSR without self-loops (they never lie on a shortest path)
+    A = sparse.csr_matrix((np.ones(len(src_pos)), (src_pos, dst_pos)), shape=(n, n))
+    A = ((A + A.T) > 0).astype(float).tocsr()
+    A.setdiag(0)
+    A.eliminate_zeros()
+    return A
+
+
+def _source_dependencies(A, sources):
+    """
+    Brandes dependencies delta_s(v) for a batch of sources, as an
+    (n_nodes x n_sources) array. The BFS and the back-propagation run level
+    by level for the whole batch as sparse x dense products.
+    """
+    n, b = A.shape[0], len(sources)
+    cols = np.arange(b)
+    sigma = np.zeros((n, b))
+    sigma[sources, cols] = 1.0
+    depth = np.full((n, b), -1, dtype=np.int32)
+    depth[sources, cols] = 0
+
+    frontier, d = sigma.copy(), 0
+    while True:
+        nxt = A @ frontier
+        nxt[depth >= 0] = 0.0
+        if not nxt.any():
+            break
+        d += 1
+        depth[nxt > 0] = d
+        sigma += nxt
+        frontier = nxt
+
+    delta = np.zeros((n, b))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for level in range(d, 0, -1):
+            t = np.where(depth == level, (1.0 + delta) / sigma, 0.0)
+            delta += np.where(depth == level - 1, sigma * (A @ t), 0.0)
+    delta[sources, cols] = 0.0
+    return delta
+
+
+def _dependency_sums(sources):
+    # Per-node sum and sum of squares of delta_s(v) over one source batch
+    delta = _source_dependencies(_BETWEENNESS_WORKER["A"], sources)
+    return delta.sum(axis=1), np.square(delta).sum(axis=1)
+
+
+def _init_betweenness_worker(A):
+    _BETWEENNESS_WORKER["A"] = A
+
+
+def _betweenness_arrays(A, engine="adaptive", k=400, tol=0.1, n_jobs=1, seed=None):
+    """
+    Normalised betweenness (as nx.betweenness_centrality(normalized=True) on
+    the undirected graph) with its standard error, from the adjacency A.
+
+    Each sampled source s gives delta_s(v); the estimate for v is the mean
+    over sampled sources s != v divided by (n - 2), which equals the exact
+    value once every source is used. The error is the standard error of that
+    mean with a finite-population correction (0 when exact). A node that no
+    sampled source reaches has no sample variance, yet unsampled sources may
+    still pass through it, so the error is floored at that of a unit
+    dependency from 3/m of the sources (the rule-of-three 95% bound when none
+    of m sampled sources had one).
+
+    engine="exact" uses every source, "sample" the first k of a seeded
+    permutation, and "adaptive" adds sources in doubling rounds until every
+    node's error is at most tol times its estimate, or times the Bridge
+    cut-off (90th percentile of the estimates) for nodes below it. Source
+    batches are fixed in advance and summed in order, so results do not
+    depend on n_jobs.
+    """
+    n = A.shape[0]
+    if engine == "exact":
+        order = np.arange(n)
+    else:
+        order = np.random.default_rng(seed).permutation(n)
+
+    batch = int(min(512, max(1, (1 << 22) // max(n, 1))))
+    if engine == "sample":
+        limits = [min(k, n)]
+    elif engine == "adaptive":
+        limits, m = [], min(n, max(64, batch))
+        while True:
+            limits.append(m)
+            if m >= n:
+                break
+            m = min(n, 2 * m)
+    else:
+        limits = [n]
+
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+
+    total, total_sq = np.zeros(n), np.zeros(n)
+    sampled = np.zeros(n, dtype=bool)
+    est, err = np.zeros(n), np.zeros(n)
+    used, rounds = 0, 0
+
+    pool = None
+    if n_jobs > 1 and n > 2:
+        pool = ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_betweenness_worker, initargs=(A,))
+    else:
+        _BETWEENNESS_WORKER["A"] = A
+    try:
+        for limit in limits:
+            if n <= 2:
+                break
+            batches = [order[lo:min(lo + batch, limit)] for lo in range(used, limit, batch)]
+            results = pool.map(_dependency_sums, batches) if pool else map(_dependency_sums, batches)
+            for part, part_sq in results:
+                total += part
+                total_sq += part_sq
+            sampled[order[used:limit]] = True
+            used, rounds = limit, rounds + 1
+
+            # Sources other than v itself that contributed to v's estimate
+            m = used - sampled
+            mean = total / np.maximum(m, 1)
+            est = mean / (n - 2)
+            if used >= n:
+                err = np.zeros(n)
+                break
+            var = np.maximum(total_sq / np.maximum(m, 1) - mean ** 2, 0.0) * m / np.maximum(m - 1, 1)
+            fpc = 1.0 - m / (n - 1)
+            p_unseen = np.minimum(1.0, 3.0 / np.maximum(m, 1))
+            var = np.maximum(var, p_unseen * (1.0 - p_unseen))
+            err = np.sqrt(var / np.maximum(m, 1) * fpc) / (n - 2)
+
+            if engine == "adaptive":
+                # Relative error, measured against the Bridge cut-off for
+                # nodes below it (whose exact value does not change labels)
+                cut = np.quantile(est, 0.9)
+                scale = np.maximum(est, cut)
+                if not scale.any() or (err <= tol * scale).all():
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        _BETWEENNESS_WORKER.clear()
+
+    stats = {
+        "engine": engine,
+        "nodes": n,
+        "sources": used,
+        "rounds": rounds,
+        "n_jobs": n_jobs,
+        "seed": seed,
+        "max_error": float(err.max()) if n else 0.0,
+    }
+    return est, err, stats
+
+
+@instrumented
+def estimate_betweenness(G, engine="adaptive", k=400, tol=0.1, n_jobs=1, seed=None):
+    """
+    Betweenness of an nx graph or SparseClientGraph, ignoring edge direction.
+    Returns (scores, errors, stats): two Series indexed by node and a dict
+    with the sources used. See _betweenness_arrays for the engines.
+    """
+    if engine not in BETWEENNESS_ENGINES or engine == "auto":
+        raise ValueError(f"Unknown engine {engine!r}; expected 'exact', 'sample' or 'adaptive'")
+    if isinstance(G, SparseClientGraph):
+        nodes, src_pos, dst_pos = G.node_ids, G.src_pos, G.dst_pos
+    else:
+        nodes = pd.Index(list(G.nodes()))
+        edges = list(G.edges())
+        src_pos = nodes.get_indexer([u for u, _ in edges])
+        dst_pos = nodes.get_indexer([v for _, v in edges])
+    A = _undirected_adjacency(len(nodes), src_pos, dst_pos)
+    est, err, stats = _betweenness_arrays(A, engine, k=k, tol=tol, n_jobs=n_jobs, seed=seed)
+    return pd.Series(est, index=nodes), pd.Series(err, index=nodes), stats
+
+
+def _levels(values, hi, mid):
+    # "High" / "Medium" / "Low" against the cut-offs (NaN -> "Low")
+    values = np.asarray(values, dtype=float)
+    return np.select([values >= hi, values >= mid], ["High", "Medium"], "Low").astype(object)
+
+def _quantile_cuts(values, q_hi=0.9, q_mid=0.6):
+    values = pd.Series(values, dtype=float)
+    return values.quantile(q_hi), values.quantile(q_mid)
+
+def _quantile_label(series: pd.Series, q_hi=0.9, q_mid=0.6):
+    if series.empty:
+        return pd.Series(index=series.index, dtype="object")
+    hi = series.quantile(q_hi)
+    mid = series.quantile(q_mid)
+    return pd.Series(_levels(series.to_numpy(), hi, mid), index=series.index)
+
+def _role_cuts(role_thresholds, q_hi=0.9, q_mid=0.6):
+    # {"degree" | "strength" | "betweenness": (hi, mid)} from pairs or sketches
+    missing = {"degree", "strength", "betweenness"}.difference(role_thresholds)
+    if missing:
+        raise ValueError(f"role_thresholds is missing {sorted(missing)}")
+    cuts = {}
+    for name in ("degree", "strength", "betweenness"):
+        value = role_thresholds[name]
+        if hasattr(value, "quantile"):
+            cuts[name] = (threshold(value, q_hi), threshold(value, q_mid))
+        else:
+            hi, mid = value
+            cuts[name] = (float(hi), float(mid))
+    return cuts
+
+def role_sketches(nodes_df, k=200, seed=None):
+    """
+    KLL sketches of a nodes_df's total degree, total strength and betweenness,
+    for build_client_network(..., role_thresholds=...). Sketches from several
+    partitions or periods combine with sketches.merge_sketches.
+    """
+    columns = {
+        "degree": nodes_df["in_degree"] + nodes_df["out_degree"],
+        "strength": nodes_df["in_strength"] + nodes_df["out_strength"],
+        "betweenness": nodes_df["betweenness"],
+    }
+    return {name: KLLSketch(k, seed=seed).update(col.to_numpy(dtype=float)) for name, col in columns.items()}
+
+def _network_roles(d, s, b):
+    # Role from the degree, strength and betweenness levels (arrays of labels)
+    d, s, b = np.asarray(d), np.asarray(s), np.asarray(b)
+    return np.select(
+        [(d == "High") & (s == "High"), b == "High", (d == "Medium") | (s == "Medium")],
+        ["Hub", "Bridge", "Connector"],
+        "Peripheral",
+    ).astype(object)
+
+
+def _client_transfers(accounts, transfers: pd.DataFrame):
+    """
+    Transfers with sender_client / recipient_client (hub_spot_deal_id of each
+    account); rows whose accounts do not map to a client are dropped.
+    `accounts` is the Accounts table or an AccountIndex.
+    Returns (t, value_col, id_col).
+    """
+    index = account_index(accounts)
+
+    # Prepare transfer edges at client level
+    t = transfers.dropna(subset=["sender_account_id", "recipient_account_id"])
+    s_code = index.lookup(t["sender_account_id"])
+    r_code = index.lookup(t["recipient_account_id"])
+    keep = (s_code >= 0) & (r_code >= 0)
+    t = t[keep].copy()
+    t["sender_account_id"]   = t["sender_account_id"].astype(int)
+    t["recipient_account_id"] = t["recipient_account_id"].astype(int)
+    t["sender_client"]       = index.client_ids[s_code[keep]]
+    t["recipient_client"]    = index.client_ids[r_code[keep]]
+
+    value_col = "normalised_amount" if "normalised_amount" in t.columns else "NormalisedAmount"
+    id_col    = "transfer_id" if "transfer_id" in t.columns else ("TransferId" if "TransferId" in t.columns else None)
+
+    return t, value_col, id_col
+
+
+@instrumented
 def build_client_network(clients: pd.DataFrame,
                          accounts: pd.DataFrame,
-                         transfers: pd.DataFrame):
+                         transfers: pd.DataFrame,
+                         backend: str = "networkx",
+                         betweenness: str = "auto",
+                         betweenness_k: int = 400,
+                         betweenness_tol: float = 0.1,
+                         n_jobs: int = 1,
+                         seed=None,
+                         role_quantiles=(0.9, 0.6),
+                         role_thresholds=None):
     import networkx as nx
     import re, math, warnings
     
-    def quantile_label(series: pd.Series, q_hi=0.9, q_mid=0.6):
-        if series.empty:
-            return pd.Series(index=series.index, dtype="object")
-        hi = series.quantile(q_hi)
-        mid = series.quantile(q_mid)
-        return series.apply(lambda v: "High" if v >= hi else ("Medium" if v >= mid else "Low"))
-    
+    quantile_label = _quantile_label
+
     """
     Build a directed client-to-client graph from transfers and compute node metrics.
     Returns: nodes_df, edges_df, G
-    """
 
-    # Map account -> client
-    acc_map = (
-        accounts[["account_id", "hub_spot_deal_id"]]
-        .dropna()
-        .drop_duplicates()
-    )
-    acc_map["hub_spot_deal_id"] = pd.to_numeric(acc_map["hub_spot_deal_id"], errors="coerce").astype("Int64")
-    acc2client = dict(zip(acc_map["account_id"].astype(int), acc_map["hub_spot_deal_id"]))
+    backend="networkx" returns G as an nx.DiGraph; backend="sparse" returns a
+    SparseClientGraph (CSR matrices, G.to_networkx() on demand). nodes_df
+    and edges_df are identical for both.
 
-    # Prepare transfer edges at client level
-    t = transfers.dropna(subset=["sender_account_id", "recipient_account_id"]).copy()
-    t["sender_account_id"]   = t["sender_account_id"].astype(int)
-    t["recipient_account_id"] = t["recipient_account_id"].astype(int)
-    t["sender_client"]       = t["sender_account_id"].map(acc2client)
-    t["recipient_client"]    = t["recipient_account_id"].map(acc2client)
-    t = t.dropna(subset=["sender_client", "recipient_client"])
+    `accounts` may be an AccountIndex built once for the accounts snapshot
+    instead of the Accounts table.
 
-    # Aggregate edge weights
-    value_col = "normalised_amount" if "normalised_amount" in t.columns else "NormalisedAmount"
-    id_col    = "transfer_id" if "transfer_id" in t.columns else ("TransferId" if "TransferId" in t.columns else None)
+    betweenness="auto" runs nx.betweenness_centrality, exactly up to 4000
+    nodes and with k=400 sampled sources above. "exact", "sample" (k =
+    betweenness_k) and "adaptive" (until the relative error is within
+    betweenness_tol) use estimate_betweenness over n_jobs processes with
+    a reproducible seed, and add a betweenness_error column (standard error,
+    0 when exact); the run is summarised in nodes_df.attrs["betweenness_stats"].
+
+    role_quantiles = (q_hi, q_mid): degree / strength / betweenness at or
+    above the q_hi quantile count as "High", above q_mid as "Medium".
+    role_thresholds={"degree": ..., "strength": ..., "betweenness": ...}
+    takes those cut-offs from elsewhere instead of this graph's own columns:
+    each entry is a (hi, mid) pair or a quantile sketch (e.g. merged
+    role_sketches from other partitions or periods) read at role_quantiles.
+    """
+    if backend not in ("networkx", "sparse"):
+        raise ValueError(f"Unknown backend {backend!r}; expected 'networkx' or 'sparse'")
+    if betweenness not in BETWEENNESS_ENGINES:
+        raise ValueError(f"Unknown betweenness engine {betweenness!r}; expected one of {BETWEENNESS_ENGINES}")
 
+    t, value_col, id_col = _client_transfers(accounts, transfers)
+
+    # Aggregate edge weights
     edges_df = (
         t.groupby(["sender_client", "recipient_client"], as_index=False)
          .agg(edge_amount=(value_col, "sum"),
               edge_count=(id_col, "count") if id_col else (value_col, "size"))
     )
 
-    # Build directed graph
-    G = nx.DiGraph()
-    for _, r in edges_df.iterrows():
-        u, v = int(r["sender_client"]), int(r["recipient_client"])
-        w, c = float(r["edge_amount"]), int(r["edge_count"])
-        if G.has_edge(u, v):
-            G[u][v]["weight"] += w
-            G[u][v]["count"]  += c
+    # Node order: as inserted into a graph, i.e. first appearance as
+    # sender/recipient in edges_df, then isolated clients
+    src = edges_df["sender_client"].astype("int64").to_numpy()
+    dst = edges_df["recipient_client"].astype("int64").to_numpy()
+    client_ids = pd.unique(clients["hub_spot_deal_id"].dropna().astype(int).to_numpy())
+    node_ids = pd.unique(np.concatenate([np.column_stack([src, dst]).ravel(), client_ids.astype(np.int64)]))
+
+    # Node metrics straight from the aggregated edge table. Strengths are
+    # accumulated in the graph's edge order (source node order, then row
+    # order), so they match a traversal of G.edges() bit for bit.
+    node_pos = pd.Index(node_ids)
+    src_pos = node_pos.get_indexer(src)
+    dst_pos = node_pos.get_indexer(dst)
+    w = edges_df["edge_amount"].astype(float).to_numpy()
+    order = np.argsort(src_pos, kind="stable")
+
+    n = len(node_ids)
+    out_strength = np.zeros(n)
+    in_strength  = np.zeros(n)
+    np.add.at(out_strength, src_pos[order], w[order])
+    np.add.at(in_strength, dst_pos[order], w[order])
+    out_degree = np.bincount(src_pos, minlength=n)
+    in_degree  = np.bincount(dst_pos, minlength=n)
+
+    # Build the graph (edges_df has one row per (sender, recipient), so bulk-load)
+    with stage("build_client_network.graph"):
+        if backend == "sparse":
+            G = SparseClientGraph(node_ids, src_pos, dst_pos, w, edges_df["edge_count"].to_numpy())
         else:
-            G.add_edge(u, v, weight=w, count=c)
-
-    # Ensure all clients appear as nodes (even if isolated)
-    for cid in clients["hub_spot_deal_id"].dropna().astype(int).unique():
-        G.add_node(int(cid))
-
-    # Node metrics
-    in_strength  = {n: 0.0 for n in G.nodes()}
-    out_strength = {n: 0.0 for n in G.nodes()}
-    for u, v, d in G.edges(data=True):
-        out_strength[u] += d.get("weight", 0.0)
-        in_strength[v]  += d.get("weight", 0.0)
-
-    in_degree  = dict(G.in_degree())
-    out_degree = dict(G.out_degree())
-
-    ug = G.to_undirected()
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        betweenness = (
-            nx.betweenness_centrality(ug, normalized=True, k=None)
-            if ug.number_of_nodes() <= 4000
-            else nx.betweenness_centrality(ug, normalized=True, k=400)
-        )
+            G = nx.DiGraph()
+            G.add_edges_from(
+                (int(u), int(v), {"weight": float(wt), "count": int(c)})
+                for u, v, wt, c in zip(src, dst, w, edges_df["edge_count"].to_numpy())
+            )
+            # Ensure all clients appear as nodes (even if isolated)
+            G.add_nodes_from(int(cid) for cid in client_ids)
+
+    bet_error, bet_stats = None, None
+    with stage("build_client_network.betweenness"):
+        if betweenness == "auto":
+            ug = G.to_undirected_networkx() if backend == "sparse" else G.to_undirected()
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                bet_scores = (
+                    nx.betweenness_centrality(ug, normalized=True, k=None)
+                    if ug.number_of_nodes() <= 4000
+                    else nx.betweenness_centrality(ug, normalized=True, k=400, seed=seed)
+                )
+        else:
+            A = _undirected_adjacency(n, src_pos, dst_pos)
+            est, bet_error, bet_stats = _betweenness_arrays(A, betweenness, k=betweenness_k, tol=betweenness_tol,
+                                                            n_jobs=n_jobs, seed=seed)
+            bet_scores = dict(zip(node_ids.tolist(), est))
 
     # Assemble nodes_df
-    nodes_df = pd.DataFrame({"hub_spot_deal_id": list(G.nodes())})
-    nodes_df["in_degree"]    = nodes_df["hub_spot_deal_id"].map(in_degree).fillna(0).astype(int)
-    nodes_df["out_degree"]   = nodes_df["hub_spot_deal_id"].map(out_degree).fillna(0).astype(int)
-    nodes_df["in_strength"]  = nodes_df["hub_spot_deal_id"].map(in_strength).fillna(0.0)
-    nodes_df["out_strength"] = nodes_df["hub_spot_deal_id"].map(out_strength).fillna(0.0)
-    nodes_df["betweenness"]  = nodes_df["hub_spot_deal_id"].map(betweenness).fillna(0.0)
+    nodes_df = pd.DataFrame({"hub_spot_deal_id": [int(x) for x in node_ids]})
+    nodes_df["in_degree"]    = in_degree.astype(int)
+    nodes_df["out_degree"]   = out_degree.astype(int)
+    nodes_df["in_strength"]  = in_strength
+    nodes_df["out_strength"] = out_strength
+    nodes_df["betweenness"]  = nodes_df["hub_spot_deal_id"].map(bet_scores).fillna(0.0)
+    if bet_error is not None:
+        nodes_df["betweenness_error"] = bet_error
 
     # Join metadata (company_name etc.)
     meta_cols = [c for c in ["company_name","group_name","vertical","segment","industry","state",
@@ -102,24 +637,225 @@ def build_client_network(clients: pd.DataFrame,
     )
 
     # Role labelling
-    deg_label = quantile_label(nodes_df["in_degree"] + nodes_df["out_degree"])
-    str_label = quantile_label(nodes_df["in_strength"] + nodes_df["out_strength"])
-    bet_label = quantile_label(nodes_df["betweenness"])
-
-    def role_row(i):
-        d, s, b = deg_label.iloc[i], str_label.iloc[i], bet_label.iloc[i]
-        if d == "High" and s == "High":
-            return "Hub"
-        if b == "High":
-            return "Bridge"
-        if d == "Medium" or s == "Medium":
-            return "Connector"
-        return "Peripheral"
-
-    nodes_df["network_role"] = [role_row(i) for i in range(len(nodes_df))]
+    q_hi, q_mid = role_quantiles
+    degree = nodes_df["in_degree"] + nodes_df["out_degree"]
+    strength = nodes_df["in_strength"] + nodes_df["out_strength"]
+    if role_thresholds is None:
+        deg_label = quantile_label(degree, q_hi, q_mid)
+        str_label = quantile_label(strength, q_hi, q_mid)
+        bet_label = quantile_label(nodes_df["betweenness"], q_hi, q_mid)
+    else:
+        cuts = _role_cuts(role_thresholds, q_hi, q_mid)
+        deg_label = _levels(degree, *cuts["degree"])
+        str_label = _levels(strength, *cuts["strength"])
+        bet_label = _levels(nodes_df["betweenness"], *cuts["betweenness"])
+
+    nodes_df["network_role"] = list(_network_roles(deg_label, str_label, bet_label))
+    if bet_stats is not None:
+        nodes_df.attrs["betweenness_stats"] = bet_stats
 
     return nodes_df, edges_df, G
 
+@instrumented
+def windowed_client_metrics(clients: pd.DataFrame,
+                            accounts: pd.DataFrame,
+                            transfers: pd.DataFrame,
+                            freq: str = "M",
+                            window: int = 1,
+                            date_col: str = "london_created_date",
+                            betweenness="auto",
+                            betweenness_k: int = 400,
+                            seed=None):
+    """
+    Per-period client network metrics as a long frame keyed by
+    (period, hub_spot_deal_id).
+
+    `accounts` is the Accounts table or an AccountIndex. Transfers are
+    bucketed by `date_col` into periods of `freq` ("D", "W",
+    "M", ...) and aggregated once into (period, sender, recipient) totals.
+    Each row then describes the window of `window` periods ending at
+    `period` (window=1: plain per-period snapshots; window=4 with freq="W":
+    rolling four weeks), built by shifting the period totals forward rather
+    than refiltering the transfers per window.
+
+    Columns: period, hub_spot_deal_id, in_degree, out_degree, in_strength,
+    out_strength, transfer_count (transfers sent + received), betweenness,
+    network_role. Only clients
+    with transfers in the window get a row, but the quantile cut-offs for
+    network_role count every client (inactive ones as 0), as in
+    build_client_network, so a window spanning all periods reproduces its
+    nodes_df. betweenness is computed per window with estimate_betweenness's
+    engines ("auto" = exact up to 4000 active clients, betweenness_k sampled
+    sources above); betweenness=None skips it (no Bridge roles).
+    """
+    if window < 1:
+        raise ValueError("window must be >= 1")
+    if betweenness is not None and betweenness not in BETWEENNESS_ENGINES:
+        raise ValueError(f"Unknown betweenness engine {betweenness!r}; expected one of {BETWEENNESS_ENGINES} or None")
+
+    t, value_col, id_col = _client_transfers(accounts, transfers)
+    t = t[t[date_col].notna()]
+    columns = ["period", "hub_spot_deal_id", "in_degree", "out_degree", "in_strength", "out_strength",
+               "transfer_count", "betweenness", "network_role"]
+    if t.empty:
+        return pd.DataFrame(columns=columns)
+
+    # One sorted aggregation to (period, sender, recipient)
+    periods = pd.DatetimeIndex(pd.to_datetime(t[date_col])).to_period(freq)
+    first = periods.min()
+    base = pd.DataFrame({
+        "p": periods.asi8 - first.ordinal,
+        "s": t["sender_client"].astype("int64").to_numpy(),
+        "d": t["recipient_client"].astype("int64").to_numpy(),
+        "amount": t[value_col].to_numpy(dtype=float),
+        "count": t[id_col].notna().to_numpy() if id_col else np.ones(len(t), dtype=bool),
+    })
+    per = base.groupby(["p", "s", "d"], sort=True).agg(amount=("amount", "sum"), count=("count", "sum")).reset_index()
+    last = int(per["p"].max())
+
+    # Each period's totals count towards the windows ending in it and the next window - 1 periods
+    if window > 1:
+        shift = np.tile(np.arange(window), len(per))
+        per = per.loc[per.index.repeat(window)].reset_index(drop=True)
+        per["p"] = per["p"].to_numpy() + shift
+        per = per[per["p"] <= last]
+        per = per.groupby(["p", "s", "d"], sort=True).agg(amount=("amount", "sum"), count=("count", "sum")).reset_index()
+
+    out_g = per.groupby(["p", "s"])
+    in_g = per.groupby(["p", "d"])
+    metrics = pd.concat([
+        in_g.size().rename("in_degree").rename_axis(["p", "c"]),
+        out_g.size().rename("out_degree").rename_axis(["p", "c"]),
+        in_g["amount"].sum().rename("in_strength").rename_axis(["p", "c"]),
+        out_g["amount"].sum().rename("out_strength").rename_axis(["p", "c"]),
+        out_g["count"].sum().rename("transfers_sent").rename_axis(["p", "c"]),
+        in_g["count"].sum().rename("transfers_received").rename_axis(["p", "c"]),
+    ], axis=1).sort_index()
+    counts = ["in_degree", "out_degree", "transfers_sent", "transfers_received"]
+    metrics[counts] = metrics[counts].fillna(0).astype(int)
+    metrics["transfer_count"] = metrics.pop("transfers_sent") + metrics.pop("transfers_received")
+    metrics[["in_strength", "out_strength"]] = metrics[["in_strength", "out_strength"]].fillna(0.0)
+
+    all_clients = set(pd.unique(clients["hub_spot_deal_id"].dropna().astype(int)).tolist())
+    all_clients.update(per["s"].tolist())
+    all_clients.update(per["d"].tolist())
+    n_all = len(all_clients)
+
+    frames = []
+    edge_groups = per.groupby("p", sort=True)
+    for p, m in metrics.groupby(level="p", sort=True):
+        m = m.droplevel("p")
+        ids = m.index.to_numpy()
+        inactive = np.zeros(n_all - len(ids))
+        degree = (m["in_degree"] + m["out_degree"]).to_numpy()
+        strength = (m["in_strength"] + m["out_strength"]).to_numpy()
+
+        bet = np.zeros(len(ids))
+        if betweenness is not None and len(ids) > 2:
+            e = edge_groups.get_group(p)
+            pos = pd.Index(ids)
+            A = _undirected_adjacency(len(ids), pos.get_indexer(e["s"]), pos.get_indexer(e["d"]))
+            engine = betweenness
+            if engine == "auto":
+                engine = "exact" if len(ids) <= 4000 else "sample"
+            est, _, _ = _betweenness_arrays(A, engine, k=betweenness_k, seed=seed)
+            # Rescale from the active clients to all clients (inactive ones lie on no path)
+            n_a = len(ids)
+            bet = est * (n_a - 1) * (n_a - 2) / ((n_all - 1) * (n_all - 2))
+
+        d_cuts = _quantile_cuts(np.concatenate([degree, inactive]))
+        s_cuts = _quantile_cuts(np.concatenate([strength, inactive]))
+        b_cuts = _quantile_cuts(np.concatenate([bet, inactive]))
+        m = m.reset_index().rename(columns={"c": "hub_spot_deal_id"})
+        m["betweenness"] = bet
+        m["network_role"] = _network_roles(_levels(degree, *d_cuts), _levels(strength, *s_cuts), _levels(bet, *b_cuts))
+        m.insert(0, "period", pd.Period(ordinal=first.ordinal + int(p), freq=first.freq))
+        frames.append(m)
+
+    out = pd.concat(frames, ignore_index=True)
+    out["network_role"] = out["network_role"].astype(str)
+    return out[columns]
+
+def _communities(ids, edges_df, seed=None, resolution=1.0):
+    # Louvain on the undirected amount-weighted graph; community labels
+    # "C0", "C1", ... by size, clients without transfers -> "Unconnected"
+    u = edges_df["sender_client"].astype("int64").to_numpy()
+    v = edges_df["recipient_client"].astype("int64").to_numpy()
+    pairs = pd.DataFrame({"u": np.minimum(u, v), "v": np.maximum(u, v),
+                          "w": edges_df["edge_amount"].astype(float).to_numpy()})
+    pairs = pairs[pairs["u"] != pairs["v"]].groupby(["u", "v"], sort=False)["w"].sum().reset_index()
+    U = nx.Graph()
+    U.add_nodes_from(ids.tolist())
+    U.add_weighted_edges_from(zip(pairs["u"].tolist(), pairs["v"].tolist(), pairs["w"].tolist()))
+    labels = pd.Series("Unconnected", index=ids, dtype=object)
+    comms = nx.community.louvain_communities(U, weight="weight", resolution=resolution, seed=seed)
+    comms = sorted((c for c in comms if len(c) > 1), key=len, reverse=True)
+    for i, members in enumerate(comms):
+        labels.loc[list(members)] = f"C{i}"
+    return labels.to_numpy()
+
+@instrumented
+def aggregate_network(nodes_df, edges_df, group_by="community", seed=None, resolution=1.0):
+    """
+    Collapses the client network into supernodes for an overview plot.
+    group_by is "community" (Louvain on the amount-weighted undirected
+    graph, reproducible with `seed`) or a nodes_df column such as
+    group_name, vertical or pod (missing -> "Unknown").
+
+    Returns (super_nodes, super_edges, membership):
+    - super_nodes: group, n_clients, in/out_strength (transfers with other
+      groups), internal_amount / internal_count (within the group),
+      dominant_role (most common network_role) and top_client (largest
+      in+out strength)
+    - super_edges: sender_group, recipient_group, edge_amount and
+      edge_count summed from edges_df, n_links (client pairs behind them)
+    - membership: group per hub_spot_deal_id, for drilling into one group
+    """
+    ids = nodes_df["hub_spot_deal_id"].astype("int64").to_numpy()
+    if group_by == "community":
+        groups = _communities(ids, edges_df, seed=seed, resolution=resolution)
+    elif group_by in nodes_df.columns:
+        col = nodes_df[group_by].astype("string").str.strip()
+        groups = col.mask(col.eq("")).fillna("Unknown").astype(object).to_numpy()
+    else:
+        raise ValueError(f"Unknown group_by {group_by!r}; expected 'community' or a nodes_df column")
+    membership = pd.Series(groups, index=pd.Index(ids, name="hub_spot_deal_id"), name="group")
+    membership = membership[~membership.index.duplicated(keep="first")]
+
+    e = pd.DataFrame({
+        "sender_group": membership.reindex(edges_df["sender_client"].astype("int64").to_numpy()).to_numpy(),
+        "recipient_group": membership.reindex(edges_df["recipient_client"].astype("int64").to_numpy()).to_numpy(),
+        "edge_amount": edges_df["edge_amount"].astype(float).to_numpy(),
+        "edge_count": edges_df["edge_count"].to_numpy(),
+    }).dropna(subset=["sender_group", "recipient_group"])
+    internal = e["sender_group"].eq(e["recipient_group"]).to_numpy()
+
+    super_edges = (
+        e[~internal]
+        .groupby(["sender_group", "recipient_group"], sort=True)
+        .agg(edge_amount=("edge_amount", "sum"), edge_count=("edge_count", "sum"),
+             n_links=("edge_amount", "size"))
+        .reset_index()
+    )
+    inside = e[internal].groupby("sender_group").agg(internal_amount=("edge_amount", "sum"),
+                                                     internal_count=("edge_count", "sum"))
+
+    members = nodes_df.assign(group=groups, _strength=nodes_df["in_strength"].fillna(0) + nodes_df["out_strength"].fillna(0))
+    super_nodes = members.groupby("group", sort=True).agg(n_clients=("hub_spot_deal_id", "size"))
+    super_nodes["out_strength"] = super_edges.groupby("sender_group")["edge_amount"].sum()
+    super_nodes["in_strength"] = super_edges.groupby("recipient_group")["edge_amount"].sum()
+    super_nodes = super_nodes.join(inside)
+    fill = ["out_strength", "in_strength", "internal_amount", "internal_count"]
+    super_nodes[fill] = super_nodes[fill].fillna(0)
+    super_nodes["internal_count"] = super_nodes["internal_count"].astype("int64")
+    if "network_role" in members.columns:
+        super_nodes["dominant_role"] = pd.crosstab(members["group"], members["network_role"]).idxmax(axis=1)
+    name_col = "company_name" if "company_name" in members.columns else "hub_spot_deal_id"
+    top = members.sort_values("_strength", ascending=False, kind="stable").drop_duplicates("group")
+    super_nodes["top_client"] = top.set_index("group")[name_col]
+    super_nodes = super_nodes.reset_index().sort_values("n_clients", ascending=False, kind="stable")
+    return super_nodes.reset_index(drop=True), super_edges, membership
+
 # def build_client_network(clients: pd.DataFrame,
 #                          accounts: pd.DataFrame,
 #                          transfers: pd.DataFrame):
@@ -162,10 +898,54 @@ def build_client_network(clients: pd.DataFrame,
 #     # ... (metrics code follows in your notebook) ...
 #     return nodes, agg, G
 
-def build_flow_pairs(transfers):
+def _fold_partials(chunks, aggregate, combine_every=8, how="sum"):
+    """
+    Folds an iterable of DataFrame chunks into one grouped frame.
+    `aggregate(chunk)` returns additive partials indexed by the group keys;
+    they are summed back together every `combine_every` chunks, so memory
+    is bounded by the number of distinct keys rather than by the rows.
+    `how` may instead be a {column: "sum" | "min" | "max"} dict; columns
+    not listed are summed.
+    Returns None if there were no chunks.
+    """
+    acc, pending = None, []
+
+    def combine(parts):
+        keys = list(range(parts[0].index.nlevels))
+        frame = pd.concat(parts)
+        grouped = frame.groupby(level=keys, dropna=False)
+        if how == "sum":
+            return grouped.sum()
+        return grouped.agg({c: how.get(c, "sum") for c in frame.columns})
+
+    for chunk in chunks:
+        pending.append(aggregate(chunk))
+        if len(pending) >= combine_every:
+            acc = combine(([acc] if acc is not None else []) + pending)
+            pending = []
+    if pending:
+        acc = combine(([acc] if acc is not None else []) + pending)
+    return acc
+
+@instrumented
+def build_flow_pairs(transfers, accounts=None, backend="pandas"):
     """
     Aggregate transfers into directional 'flow pairs' between participants.
 
+    With `accounts` (the Accounts table or an AccountIndex) the participants
+    are clients: source_id / destination_id are hub_spot_deal_ids and
+    transfers whose accounts do not map to a client are dropped, as in
+    build_client_network.
+
+    `transfers` is a DataFrame, or an iterable of DataFrame chunks (e.g.
+    pd.read_csv(..., chunksize=...) or data_io.iter_parquet_batches) which is
+    folded chunk by chunk into running (sender, recipient) counts and sums.
+    The streamed output has the same rows and columns; totals can differ in
+    the last bits because the float sums are added in a different order.
+
+    backend="duckdb" runs the aggregation out of core (see outofcore);
+    `transfers` may then also be a Parquet file, directory or glob.
+
     Output columns:
       - source_id
       - destination_id
@@ -179,15 +959,47 @@ def build_flow_pairs(transfers):
     ref_col = 'transfer_id'
     amount_col = 'normalised_amount'
     
+    outofcore.check_backend(backend)
+    index = account_index(accounts) if accounts is not None else None
+
+    if backend == "duckdb":
+        acc = None
+        if index is not None:
+            known = index.codes >= 0
+            acc = pd.DataFrame({"account_id": index.account_ids[known],
+                                "client_id": index.client_ids[index.codes[known]]})
+        out = outofcore.flow_pairs(transfers, acc)
+        if isinstance(transfers, pd.DataFrame):
+            out = outofcore.cast_like(out, build_flow_pairs(transfers.iloc[:0], accounts=index))
+        return out
+
     # aggregate
 
-    agg = (
-        transfers
-        .groupby([source_col, dest_col], dropna=False)
-        .agg(
-            transfer_count=(ref_col, 'count'),
-            total_value=(amount_col, 'sum')
+    def _aggregate(df):
+        if index is not None:
+            src = index.lookup(df[source_col])
+            dst = index.lookup(df[dest_col])
+            keep = (src >= 0) & (dst >= 0)
+            df = df[keep].assign(**{source_col: index.client_ids[src[keep]],
+                                    dest_col: index.client_ids[dst[keep]]})
+        return (
+            df
+            .groupby([source_col, dest_col], dropna=False)
+            .agg(
+                transfer_count=(ref_col, 'count'),
+                total_value=(amount_col, 'sum')
+            )
         )
+
+    if isinstance(transfers, pd.DataFrame):
+        grouped = _aggregate(transfers)
+    else:
+        grouped = _fold_partials(transfers, _aggregate)
+        if grouped is None:
+            return pd.DataFrame(columns=['source_id', 'destination_id', 'transfer_count', 'total_value'])
+
+    agg = (
+        grouped
         .reset_index()
         .rename(columns={source_col: 'source_id', dest_col: 'destination_id'})
     )
@@ -195,20 +1007,40 @@ def build_flow_pairs(transfers):
     return agg
 
 
-def participant_metrics(flow_pairs):
-    """
-    Compute per-participant stats from directional flow pairs.
+def _interaction_profiles(unique_destinations, unique_sources, unique_counterparties):
+    # Profile rules, first match wins
+    dst = np.asarray(unique_destinations, dtype=float)
+    src = np.asarray(unique_sources, dtype=float)
+    both = np.asarray(unique_counterparties, dtype=float)
+    return np.select(
+        [
+            both == 0,
+            (dst >= 5) & (src >= 5),
+            ((dst >= 5) & (src < 5)) | ((src >= 5) & (dst < 5)),
+            both <= 2,
+        ],
+        ['Isolated', 'Hub', 'Broker', 'Peripheral Member'],
+        'Regular Member',
+    ).astype(object)
 
-    Output columns:
-      - participant_id
-      - unique_destinations   (distinct counterparties they send to)
-      - unique_sources        (distinct counterparties they receive from)
-      - unique_counterparties (sum of the above)
-      - total_sent            (sum of total_value where they are source)
-      - total_received        (sum of total_value where they are destination)
-      - has_two_way_flow      (True if flows both ways)
-      - interaction_profile   ('Hub'/'Broker'/'Spoke'/'Member'/'Isolated')
+
+def _two_way_participants(src, dst):
+    """
+    Ids that take part in a corridor flowing both ways (a -> b and b -> a,
+    or a self-loop). Pairs are packed into one int64 key over factorised ids
+    and reverse keys are looked up with isin; missing ids never match.
     """
+    codes, uniques = pd.factorize(np.concatenate([np.asarray(src), np.asarray(dst)]))
+    s_code, d_code = codes[:len(src)].astype(np.int64), codes[len(src):].astype(np.int64)
+    k = max(len(uniques), 1)
+    valid = (s_code >= 0) & (d_code >= 0)
+    key = s_code[valid] * k + d_code[valid]
+    reverse = d_code[valid] * k + s_code[valid]
+    hit = pd.Index(reverse).isin(key)
+    return uniques.take(np.unique(np.concatenate([s_code[valid][hit], d_code[valid][hit]])))
+
+
+def _participant_parts(flow_pairs):
     required = {'source_id', 'destination_id', 'transfer_count', 'total_value'}
     missing = required.difference(flow_pairs.columns)
     if missing:
@@ -224,35 +1056,55 @@ def participant_metrics(flow_pairs):
     sent = fp.groupby('source_id')['total_value'].sum().rename('total_sent')
     received = fp.groupby('destination_id')['total_value'].sum().rename('total_received')
 
+    # Two-way flow without temp columns
+    two_way = _two_way_participants(fp['source_id'].to_numpy(), fp['destination_id'].to_numpy())
+    return unique_dest, unique_src, sent, received, two_way
+
+
+def _assemble_participants(unique_dest, unique_src, sent, received, two_way):
     participants = pd.concat([unique_dest, unique_src, sent, received], axis=1).fillna(0.0)
     participants.index.name = 'participant_id'
     participants['unique_counterparties'] = participants['unique_destinations'] + participants['unique_sources']
-
-    # Two-way flow without temp columns
-    corridors = set(tuple(x) for x in fp[['source_id','destination_id']].itertuples(index=False, name=None))
-    two_way = set()
-    for s, d in corridors:
-        if (d, s) in corridors:
-            two_way.add(s); two_way.add(d)
-    participants['has_two_way_flow'] = participants.index.map(lambda x: x in two_way)
+    participants['has_two_way_flow'] = participants.index.isin(two_way)
 
     # profile rules
-    def _profile(row):
-        if row['unique_counterparties'] == 0:
-            return 'Isolated'
-        if row['unique_destinations'] >= 5 and row['unique_sources'] >= 5:
-            return 'Hub'
-        if (row['unique_destinations'] >= 5 and row['unique_sources'] < 5) or \
-           (row['unique_sources'] >= 5 and row['unique_destinations'] < 5):
-            return 'Broker'
-        if row['unique_counterparties'] <= 2:
-            return 'Peripheral Member'
-        return 'Regular Member'
-
-    participants['interaction_profile'] = participants.apply(_profile, axis=1)
+    participants['interaction_profile'] = _interaction_profiles(
+        participants['unique_destinations'], participants['unique_sources'], participants['unique_counterparties']
+    )
     return participants.reset_index()
 
 
+@instrumented
+def participant_metrics(flow_pairs, backend="pandas"):
+    """
+    Compute per-participant stats from directional flow pairs.
+
+    Output columns:
+      - participant_id
+      - unique_destinations   (distinct counterparties they send to)
+      - unique_sources        (distinct counterparties they receive from)
+      - unique_counterparties (sum of the above)
+      - total_sent            (sum of total_value where they are source)
+      - total_received        (sum of total_value where they are destination)
+      - has_two_way_flow      (True if flows both ways)
+      - interaction_profile   ('Hub'/'Broker'/'Spoke'/'Member'/'Isolated')
+
+    backend="duckdb" groups the pairs out of core (see outofcore);
+    `flow_pairs` may then also be a Parquet path.
+    """
+    outofcore.check_backend(backend)
+    if backend == "duckdb":
+        parts = outofcore.participant_parts(flow_pairs)
+        if isinstance(flow_pairs, pd.DataFrame):
+            # dtypes as the pandas path gives them
+            template = _participant_parts(flow_pairs.iloc[:0])
+            parts = [p.astype(t.dtype).set_axis(p.index.astype(t.index.dtype))
+                     for p, t in zip(parts[:4], template[:4])] + [parts[4]]
+        return _assemble_participants(*parts)
+    return _assemble_participants(*_participant_parts(flow_pairs))
+
+
+@instrumented
 def top_participants(participants, n = 15):
     """
     Rank participants by size and value of activity.
@@ -261,52 +1113,552 @@ def top_participants(participants, n = 15):
     keep = [c for c in order if c in participants.columns]
     return participants.sort_values(keep, ascending=False).head(n)
 
-def build_counterparty_metrics(df, entity_col, amount_col, role):
+
+LEDGER_COLUMNS = ["hub_spot_deal_id",
+                  "deposit_total", "deposit_count", "withdrawal_total", "withdrawal_count",
+                  "transfer_in_total", "transfer_in_count", "transfer_out_total", "transfer_out_count",
+                  "internal_total", "internal_count", "fee_total", "inflow", "outflow", "net_position"]
+_FEE_SUFFIX = "_fee_normalised"
+
+
+def _table_chunks(table):
+    if table is None:
+        return []
+    return [table] if isinstance(table, pd.DataFrame) else table
+
+
+def _column(chunk, col):
+    # Float values with missing as 0 (zeros when the column is absent)
+    if col not in chunk.columns:
+        return np.zeros(len(chunk))
+    return np.nan_to_num(pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=float, na_value=np.nan))
+
+
+@instrumented
+def build_client_ledger(accounts, deposits=None, withdrawals=None, transfers=None,
+                        amount_col: str = "normalised_amount"):
     """
-    Aggregates to one row per counterparty with total £ value, tx count, and avg ticket.
-    - entity_col: the *standardised* name column
-    - amount_col: numeric amount column (use your 'normalised_amount')
-    - role: 'remitter' or 'beneficiary'
+    Per-client money in and out across deposits, withdrawals and transfers.
+
+    `accounts` is the Accounts table or an AccountIndex; each table (or an
+    iterable of its chunks) is mapped to hub_spot_deal_id through it once and
+    summed with np.bincount over the client codes. Transfers between two
+    accounts of the same client count as internal, not as in/out.
+
+    One row per client in `accounts`, by hub_spot_deal_id, columns:
+      - deposit_total / deposit_count, withdrawal_total / withdrawal_count
+      - transfer_in_total / _count, transfer_out_total / _count (other clients
+        or unmapped accounts on the far side)
+      - internal_total / internal_count
+      - fee_total  (deposit, withdrawal, sender and receiver fees borne by the client)
+      - inflow = deposits + transfers in, outflow = withdrawals + transfers out,
+        net_position = inflow - outflow
+    Rows whose account does not map to a client are left out and counted in
+    attrs["ledger_stats"].
     """
-    tmp = df[[entity_col, amount_col]].copy()
+    index = account_index(accounts)
+    n = len(index.client_ids)
+    totals = {c: np.zeros(n) for c in LEDGER_COLUMNS[1:12] if not c.endswith("_count")}
+    counts = {c: np.zeros(n, dtype=np.int64) for c in LEDGER_COLUMNS[1:12] if c.endswith("_count")}
+    stats = {"deposits": 0, "withdrawals": 0, "transfers": 0, "unmapped_rows": 0}
 
-    # clean up
-    tmp[entity_col] = (
-        tmp[entity_col]
+    def add(name, codes, values, mask=None):
+        keep = codes >= 0 if mask is None else mask
+        totals[f"{name}_total"] += np.bincount(codes[keep], weights=values[keep], minlength=n)
+        counts[f"{name}_count"] += np.bincount(codes[keep], minlength=n)
+
+    def add_fee(codes, fees, mask=None):
+        keep = codes >= 0 if mask is None else mask
+        totals["fee_total"] += np.bincount(codes[keep], weights=fees[keep], minlength=n)
+
+    for table, name in ((deposits, "deposit"), (withdrawals, "withdrawal")):
+        for chunk in _table_chunks(table):
+            codes = index.lookup(chunk["account_id"])
+            add(name, codes, _column(chunk, amount_col))
+            add_fee(codes, _column(chunk, f"{name}{_FEE_SUFFIX}"))
+            stats[f"{name}s"] += len(chunk)
+            stats["unmapped_rows"] += int((codes < 0).sum())
+
+    for chunk in _table_chunks(transfers):
+        src = index.lookup(chunk["sender_account_id"])
+        dst = index.lookup(chunk["recipient_account_id"])
+        amount = _column(chunk, amount_col)
+        internal = (src >= 0) & (src == dst)
+        add("internal", src, amount, internal)
+        add("transfer_out", src, amount, (src >= 0) & ~internal)
+        add("transfer_in", dst, amount, (dst >= 0) & ~internal)
+        add_fee(src, _column(chunk, f"sender{_FEE_SUFFIX}"))
+        add_fee(dst, _column(chunk, f"reciever{_FEE_SUFFIX}"))
+        stats["transfers"] += len(chunk)
+        stats["unmapped_rows"] += int(((src < 0) & (dst < 0)).sum())
+
+    # Counts as int32 to keep the frame compact
+    counts = {c: v.astype(np.int32) for c, v in counts.items()}
+    ledger = pd.DataFrame({"hub_spot_deal_id": pd.array(index.client_ids, dtype="Int64"), **totals, **counts})
+    ledger["inflow"] = ledger["deposit_total"] + ledger["transfer_in_total"]
+    ledger["outflow"] = ledger["withdrawal_total"] + ledger["transfer_out_total"]
+    ledger["net_position"] = ledger["inflow"] - ledger["outflow"]
+    ledger = ledger[LEDGER_COLUMNS].sort_values("hub_spot_deal_id", ignore_index=True)
+    ledger.attrs["ledger_stats"] = stats
+    return ledger
+
+class NetworkState:
+    """
+    Incrementally maintained transfer network for append-only batches of
+    transfers (e.g. one day at a time). `accounts` is the Accounts table or
+    an AccountIndex (only used at client level).
+
+    level="client" aggregates to client-to-client edges as in
+    build_client_network; level="account" keeps account ids as in
+    build_flow_pairs. Each append() updates only what the batch touches:
+      - the aggregated edge table (amount and count per sender -> recipient)
+      - per-node degree (= unique counterparties) and strength
+      - two-way flags, interaction_profile and network_role of the affected nodes
+    Betweenness and the quantile cut-offs behind network_role are global:
+    append() marks them stale and refresh() (or a view with refresh=True)
+    recomputes them and relabels every node. Between refreshes affected nodes
+    are labelled with the current degree/strength cut-offs and the last
+    computed betweenness (0 for nodes added since).
+
+    Views: edges(), participants() (participant_metrics columns) and
+    nodes() (build_client_network nodes_df columns, rows in order of first
+    appearance, then clients without transfers). Totals match the batch
+    functions up to float summation order.
+    """
+
+    def __init__(self, clients: pd.DataFrame, accounts: pd.DataFrame, level: str = "client",
+                 betweenness: str = "auto", betweenness_k: int = 400, betweenness_tol: float = 0.1,
+                 n_jobs: int = 1, seed=None):
+        if level not in ("client", "account"):
+            raise ValueError(f"Unknown level {level!r}; expected 'client' or 'account'")
+        if betweenness not in BETWEENNESS_ENGINES:
+            raise ValueError(f"Unknown betweenness engine {betweenness!r}; expected one of {BETWEENNESS_ENGINES}")
+        self.level = level
+        self.clients = clients
+        self.betweenness_params = dict(engine=betweenness, k=betweenness_k, tol=betweenness_tol,
+                                       n_jobs=n_jobs, seed=seed)
+
+        self._accounts = account_index(accounts) if level == "client" else None
+        # Clients with no transfers yet, kept in table order (nodes with zero metrics)
+        client_ids = pd.unique(clients["hub_spot_deal_id"].dropna().astype(int).to_numpy())
+        self._isolated = dict.fromkeys(client_ids.tolist()) if level == "client" else {}
+
+        self._node_pos, self._node_ids = {}, []
+        self._edge_pos, self._edge_src, self._edge_dst = {}, [], []
+        self._edge_amount = np.zeros(0)
+        self._edge_count = np.zeros(0, dtype=np.int64)
+        self._in_degree = np.zeros(0, dtype=np.int64)
+        self._out_degree = np.zeros(0, dtype=np.int64)
+        self._in_strength = np.zeros(0)
+        self._out_strength = np.zeros(0)
+        self._mutual = np.zeros(0, dtype=np.int64)
+        self._betweenness = np.zeros(0)
+        self._betweenness_error = np.zeros(0)
+        self._bet_cuts = None
+        self._isolated_role = None
+        self._profile = np.zeros(0, dtype=object)
+        self._role = np.zeros(0, dtype=object)
+
+        self.stale = True
+        self.stats = {"batches": 0, "transfers": 0, "refreshes": 0, "last_affected": 0}
+
+    def __len__(self):
+        return len(self._node_ids)
+
+    @property
+    def number_of_edges(self):
+        return len(self._edge_src)
+
+    def _grow(self, arr, size, fill=0):
+        if len(arr) >= size:
+            return arr
+        out = np.full(max(size, 2 * len(arr)), fill, dtype=arr.dtype)
+        out[:len(arr)] = arr
+        return out
+
+    def _add_nodes(self, ids):
+        for x in ids:
+            if x not in self._node_pos:
+                self._node_pos[x] = len(self._node_ids)
+                self._node_ids.append(x)
+                self._isolated.pop(x, None)
+        n = len(self._node_ids)
+        self._in_degree = self._grow(self._in_degree, n)
+        self._out_degree = self._grow(self._out_degree, n)
+        self._in_strength = self._grow(self._in_strength, n)
+        self._out_strength = self._grow(self._out_strength, n)
+        self._mutual = self._grow(self._mutual, n)
+        self._betweenness = self._grow(self._betweenness, n)
+        self._betweenness_error = self._grow(self._betweenness_error, n)
+        self._profile = self._grow(self._profile, n, fill=None)
+        self._role = self._grow(self._role, n, fill=None)
+
+    def _batch_edges(self, transfers):
+        # (sender, recipient, amount, count) totals for one batch
+        t = transfers.dropna(subset=["sender_account_id", "recipient_account_id"])
+        src = t["sender_account_id"].astype(int).to_numpy()
+        dst = t["recipient_account_id"].astype(int).to_numpy()
+        if self._accounts is not None:
+            src = self._accounts.map(src)
+            dst = self._accounts.map(dst)
+        value_col = "normalised_amount" if "normalised_amount" in t.columns else "NormalisedAmount"
+        id_col = "transfer_id" if "transfer_id" in t.columns else ("TransferId" if "TransferId" in t.columns else None)
+        b = pd.DataFrame({
+            "s": src, "d": dst,
+            "v": t[value_col].to_numpy(),
+            "c": t[id_col].notna().to_numpy() if id_col else np.ones(len(t), dtype=bool),
+        }).dropna(subset=["s", "d"])
+        g = b.groupby(["s", "d"], sort=False).agg(amount=("v", "sum"), count=("c", "sum"))
+        s_ids = g.index.get_level_values(0).astype("int64").to_numpy()
+        d_ids = g.index.get_level_values(1).astype("int64").to_numpy()
+        return s_ids, d_ids, g["amount"].to_numpy(dtype=float), g["count"].to_numpy(dtype=np.int64), len(b)
+
+    @instrumented
+    def append(self, transfers: pd.DataFrame):
+        """
+        Folds a batch of new transfers into the state. Returns the ids of the
+        nodes whose metrics changed.
+        """
+        s_ids, d_ids, amount, count, rows = self._batch_edges(transfers)
+        self._add_nodes(pd.unique(np.column_stack([s_ids, d_ids]).ravel()).tolist())
+        sp = np.fromiter((self._node_pos[x] for x in s_ids.tolist()), dtype=np.int64, count=len(s_ids))
+        dp = np.fromiter((self._node_pos[x] for x in d_ids.tolist()), dtype=np.int64, count=len(d_ids))
+
+        epos = np.empty(len(sp), dtype=np.int64)
+        for k, (a, b) in enumerate(zip(sp.tolist(), dp.tolist())):
+            e = self._edge_pos.get((a, b))
+            if e is None:
+                e = self._edge_pos[(a, b)] = len(self._edge_src)
+                self._edge_src.append(a)
+                self._edge_dst.append(b)
+                self._out_degree[a] += 1
+                self._in_degree[b] += 1
+                # Two-way: a self-loop, or the reverse corridor already exists
+                if a == b:
+                    self._mutual[a] += 1
+                elif (b, a) in self._edge_pos:
+                    self._mutual[a] += 1
+                    self._mutual[b] += 1
+            epos[k] = e
+
+        m = len(self._edge_src)
+        self._edge_amount = self._grow(self._edge_amount, m)
+        self._edge_count = self._grow(self._edge_count, m)
+        np.add.at(self._edge_amount, epos, amount)
+        np.add.at(self._edge_count, epos, count)
+        np.add.at(self._out_strength, sp, amount)
+        np.add.at(self._in_strength, dp, amount)
+
+        affected = np.unique(np.concatenate([sp, dp]))
+        self._relabel(affected)
+        self.stale = True
+        self.stats["batches"] += 1
+        self.stats["transfers"] += rows
+        self.stats["last_affected"] = len(affected)
+        return [self._node_ids[i] for i in affected.tolist()]
+
+    def _population(self, values):
+        # Values over all nodes, clients without transfers counting as 0
+        return np.concatenate([values, np.zeros(len(self._isolated))])
+
+    def _relabel(self, positions):
+        n = len(self._node_ids)
+        indeg, outdeg = self._in_degree[:n], self._out_degree[:n]
+        degree = indeg + outdeg
+        strength = self._in_strength[:n] + self._out_strength[:n]
+        d_hi, d_mid = _quantile_cuts(self._population(degree))
+        s_hi, s_mid = _quantile_cuts(self._population(strength))
+        b_hi, b_mid = self._bet_cuts if self._bet_cuts is not None else (np.inf, np.inf)
+        self._isolated_role = _network_roles(_levels([0], d_hi, d_mid), _levels([0], s_hi, s_mid),
+                                             _levels([0], b_hi, b_mid))[0]
+        self._profile[positions] = _interaction_profiles(outdeg[positions], indeg[positions], degree[positions])
+        self._role[positions] = _network_roles(_levels(degree[positions], d_hi, d_mid),
+                                               _levels(strength[positions], s_hi, s_mid),
+                                               _levels(self._betweenness[positions], b_hi, b_mid))
+
+    def graph(self):
+        """
+        The current network as a SparseClientGraph (clients without transfers included).
+        """
+        node_ids = np.array(self._node_ids + list(self._isolated), dtype=np.int64)
+        m = self.number_of_edges
+        return SparseClientGraph(node_ids, self._edge_src, self._edge_dst,
+                                 self._edge_amount[:m], self._edge_count[:m])
+
+    @instrumented
+    def refresh(self):
+        """
+        Recomputes betweenness and the quantile cut-offs, then relabels every node.
+        """
+        G = self.graph()
+        n, total = len(self._node_ids), G.number_of_nodes()
+        params = self.betweenness_params
+        if params["engine"] == "auto":
+            ug = G.to_undirected_networkx()
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                scores = (
+                    nx.betweenness_centrality(ug, normalized=True, k=None)
+                    if total <= 4000
+                    else nx.betweenness_centrality(ug, normalized=True, k=400, seed=params["seed"])
+                )
+            est = np.array([scores.get(x, 0.0) for x in G.node_ids.tolist()])
+        else:
+            A = _undirected_adjacency(total, G.src_pos, G.dst_pos)
+            est, err, _ = _betweenness_arrays(A, params["engine"], k=params["k"], tol=params["tol"],
+                                              n_jobs=params["n_jobs"], seed=params["seed"])
+            self._betweenness_error[:n] = err[:n]
+        # Clients without transfers are isolated, so their betweenness is 0
+        self._betweenness[:n] = est[:n]
+        self._bet_cuts = _quantile_cuts(est)
+        self._relabel(np.arange(n))
+        self.stale = False
+        self.stats["refreshes"] += 1
+        return self
+
+    def edges(self):
+        """
+        Aggregated edge table: edges_df columns at client level, build_flow_pairs
+        columns at account level; rows in order of first appearance.
+        """
+        m = self.number_of_edges
+        ids = np.array(self._node_ids, dtype=np.int64)
+        src = ids[np.array(self._edge_src, dtype=np.int64)]
+        dst = ids[np.array(self._edge_dst, dtype=np.int64)]
+        if self.level == "account":
+            return pd.DataFrame({"source_id": src, "destination_id": dst,
+                                 "transfer_count": self._edge_count[:m], "total_value": self._edge_amount[:m]})
+        return pd.DataFrame({"sender_client": src, "recipient_client": dst,
+                             "edge_amount": self._edge_amount[:m], "edge_count": self._edge_count[:m]})
+
+    def participants(self):
+        """
+        participant_metrics for the nodes seen in transfers, in its row order
+        (senders by id, then recipient-only participants by id).
+        """
+        n = len(self._node_ids)
+        out = pd.DataFrame({
+            "participant_id": self._node_ids,
+            "unique_destinations": self._out_degree[:n].astype(float),
+            "unique_sources": self._in_degree[:n].astype(float),
+            "total_sent": self._out_strength[:n],
+            "total_received": self._in_strength[:n],
+        })
+        out["unique_counterparties"] = out["unique_destinations"] + out["unique_sources"]
+        out["has_two_way_flow"] = self._mutual[:n] > 0
+        out["interaction_profile"] = self._profile[:n]
+        out["_receiver_only"] = self._out_degree[:n] == 0
+        out = out.sort_values(["_receiver_only", "participant_id"], kind="stable")
+        return out.drop(columns="_receiver_only").reset_index(drop=True)
+
+    @instrumented
+    def nodes(self, refresh: bool = True):
+        """
+        nodes_df as from build_client_network. With refresh=True stale global
+        metrics are recomputed first; refresh=False returns the incremental
+        view immediately.
+        """
+        if refresh and self.stale:
+            self.refresh()
+        n = len(self._node_ids)
+        id_col = "hub_spot_deal_id" if self.level == "client" else "account_id"
+        nodes_df = pd.DataFrame({
+            id_col: self._node_ids + list(self._isolated),
+            "in_degree": self._population(self._in_degree[:n]).astype(int),
+            "out_degree": self._population(self._out_degree[:n]).astype(int),
+            "in_strength": self._population(self._in_strength[:n]),
+            "out_strength": self._population(self._out_strength[:n]),
+            "betweenness": self._population(self._betweenness[:n]),
+        })
+        if self.betweenness_params["engine"] != "auto":
+            nodes_df["betweenness_error"] = self._population(self._betweenness_error[:n])
+        roles = list(self._role[:n]) + [self._isolated_role] * len(self._isolated)
+
+        if self.level == "client":
+            meta_cols = [c for c in ["company_name","group_name","vertical","segment","industry","state",
+                                     "risk_rating","pod","group_country_incorp","company_country_incorp"]
+                         if c in self.clients.columns]
+            nodes_df["network_role"] = roles
+            nodes_df = nodes_df.merge(
+                self.clients[["hub_spot_deal_id"] + meta_cols].drop_duplicates(),
+                on="hub_spot_deal_id", how="left"
+            )
+            nodes_df["network_role"] = nodes_df.pop("network_role")
+        else:
+            nodes_df["network_role"] = roles
+        return nodes_df
+
+
+_SUMMARY_MIN_MAX = {"first_date": "min", "last_date": "max"}
+
+
+def _resolve_column(df, col, default, what):
+    # "auto" -> `default` when the frame has it (None if not); None disables
+    if col is None:
+        return None
+    if col == "auto":
+        if callable(default):
+            return default(df.columns)
+        return default if default in df.columns else None
+    if col not in df.columns:
+        raise ValueError(f"{what} column {col!r} not found")
+    return col
+
+
+def _counterparty_partials(chunk, entity_col, amount_col, fee_col, date_col, currency_col):
+    """
+    One grouped pass over a chunk: the entity is factorised once and every
+    aggregate (sums, count, min/max date, value per currency) is taken
+    against those codes. Indexed by the cleaned counterparty name.
+    """
+    entity = (
+        chunk[entity_col]
         .fillna("Unknown")
         .astype(str)
         .str.strip()
         .replace({"": "Unknown"})
     )
-    tmp[amount_col] = pd.to_numeric(tmp[amount_col], errors="coerce").fillna(0)
-
-    g = (
-        tmp.groupby(entity_col, dropna=False)
-           .agg(value_total=(amount_col, "sum"),
-                volume_total=(amount_col, "size"))
-           .reset_index()
-           .rename(columns={entity_col: "counterparty"})
-    )
+    codes, names = pd.factorize(entity, sort=True)
+    cols = {
+        "value_total": pd.to_numeric(chunk[amount_col], errors="coerce").fillna(0),
+    }
+    if fee_col is not None:
+        cols["fee_total"] = pd.to_numeric(chunk[fee_col], errors="coerce").fillna(0)
+    if date_col is not None:
+        dates = pd.to_datetime(chunk[date_col], errors="coerce")
+        cols["first_date"] = dates
+        cols["last_date"] = dates
+    frame = pd.DataFrame(cols)
+    named = {c: (c, _SUMMARY_MIN_MAX.get(c, "sum")) for c in cols}
+    named["volume_total"] = ("value_total", "size")
+    out = frame.groupby(codes, sort=True).agg(**named)
+
+    if currency_col is not None:
+        ccy_codes, currencies = pd.factorize(chunk[currency_col].astype("string").str.strip(), sort=True)
+        known = ccy_codes >= 0
+        k = max(len(currencies), 1)
+        mix = frame["value_total"].to_numpy()[known]
+        mix = pd.Series(mix).groupby(codes[known] * k + ccy_codes[known], sort=True).sum()
+        key = mix.index.to_numpy()
+        if len(key) == 0:
+            return out.set_axis(pd.Index(names[out.index], name="counterparty"))
+        wide = pd.Series(mix.to_numpy(), index=pd.MultiIndex.from_arrays([key // k, key % k])).unstack(fill_value=0.0)
+        wide.columns = [f"ccy:{currencies[c]}" for c in wide.columns]
+        out = out.join(wide)
+    out.index = pd.Index(names[out.index], name="counterparty")
+    return out
+
+
+def _finish_summary(grouped, role):
+    g = grouped.reset_index()
+    g["volume_total"] = g["volume_total"].astype("int64")
     g["role"] = role
-    return g
-
-def classify_quadrants(metrics):
-    df = metrics.copy()
-    df["_value_m"] = df["value_total"] / 1e6
-    df["_volume"]  = df["volume_total"]
-    v_med = float(df["_value_m"].median())
-    q_med = float(df["_volume"].median())
-
-    def _quad(row):
-        if row["_value_m"] >= v_med and row["_volume"] >= q_med:
-            return "High Value / High Volume"
-        if row["_value_m"] < v_med and row["_volume"] >= q_med:
-            return "Low Value / High Volume"
-        if row["_value_m"] >= v_med and row["_volume"] < q_med:
-            return "High Value / Low Volume"
-        return "Low Value / Low Volume"
-
-    out = df.copy()
-    out["quadrant"] = out.apply(_quad, axis=1)
-    cols = ["counterparty", "role", "value_total", "volume_total", "quadrant"]
-    return out[cols].sort_values(by=["value_total"], ascending=False)
+    g["avg_ticket"] = g["value_total"] / g["volume_total"]
+    ccy = [c for c in g.columns if c.startswith("ccy:")]
+    if ccy:
+        mix = g[ccy].fillna(0.0).to_numpy()
+        total = np.abs(mix).sum(axis=1)
+        top = np.abs(mix).argmax(axis=1)
+        names = np.array([c[4:] for c in ccy], dtype=object)
+        g = g.drop(columns=ccy)
+        g["currency_count"] = (mix != 0).sum(axis=1)
+        g["main_currency"] = np.where(total > 0, names[top], None)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            g["main_currency_share"] = np.where(total > 0, np.abs(mix)[np.arange(len(g)), top] / total, np.nan)
+    order = ["counterparty", "value_total", "volume_total", "role", "avg_ticket", "fee_total",
+             "first_date", "last_date", "currency_count", "main_currency", "main_currency_share"]
+    return g[[c for c in order if c in g.columns]]
+
+
+@instrumented
+def summarise_counterparties(df, entity_col, amount_col="normalised_amount", role=None,
+                             fee_col="auto", date_col="auto", currency_col="auto"):
+    """
+    One row per counterparty from a standardised Deposits / Withdrawals table,
+    computed in a single grouped pass:
+    value_total, volume_total, avg_ticket, fee_total, first_date, last_date,
+    currency_count (currencies with non-zero value), main_currency and
+    main_currency_share (its share of the absolute value).
+
+    fee_col="auto" picks the `*_fee_normalised` column, date_col="auto"
+    london_value_date and currency_col="auto" currency, when present; pass
+    None to skip one. Names are cleaned as in build_counterparty_metrics
+    (missing/blank -> "Unknown"), so value_total and volume_total match it.
+    `df` may also be an iterable of DataFrame chunks (see build_flow_pairs).
+    """
+    def _columns(frame):
+        return (
+            _resolve_column(frame, fee_col, lambda cols: next((c for c in cols if str(c).endswith(_FEE_SUFFIX)), None), "Fee"),
+            _resolve_column(frame, date_col, "london_value_date", "Date"),
+            _resolve_column(frame, currency_col, "currency", "Currency"),
+        )
+
+    def _aggregate(chunk):
+        return _counterparty_partials(chunk, entity_col, amount_col, *_columns(chunk))
+
+    if isinstance(df, pd.DataFrame):
+        grouped = _aggregate(df)
+    else:
+        grouped = _fold_partials(df, _aggregate, how=_SUMMARY_MIN_MAX)
+        if grouped is None:
+            return pd.DataFrame(columns=["counterparty", "value_total", "volume_total", "role", "avg_ticket"])
+    return _finish_summary(grouped, role)
+
+
+@instrumented
+def build_counterparty_metrics(df, entity_col, amount_col, role, backend="pandas"):
+    """
+    Aggregates to one row per counterparty with total £ value and tx count.
+    - entity_col: the *standardised* name column
+    - amount_col: numeric amount column (use your 'normalised_amount')
+    - role: 'remitter' or 'beneficiary'
+    `df` may also be an iterable of DataFrame chunks, folded into running
+    per-counterparty value and volume totals (see build_flow_pairs).
+    summarise_counterparties adds fees, dates and currency mix in the same pass.
+    backend="duckdb" aggregates out of core (see outofcore); `df` may then
+    also be a Parquet path.
+    """
+    outofcore.check_backend(backend)
+    if backend == "duckdb":
+        out = outofcore.counterparty_totals(df, entity_col, amount_col)
+        out["role"] = role
+        if isinstance(df, pd.DataFrame):
+            out = outofcore.cast_like(out, build_counterparty_metrics(df.iloc[:0], entity_col, amount_col, role))
+        return out
+    out = summarise_counterparties(df, entity_col, amount_col, role,
+                                   fee_col=None, date_col=None, currency_col=None)
+    return out[["counterparty", "value_total", "volume_total", "role"]]
+
+QUADRANTS = ("High Value / High Volume", "Low Value / High Volume",
+             "High Value / Low Volume", "Low Value / Low Volume")
+
+
+@instrumented
+def classify_quadrants(metrics, thresholds=None):
+    """
+    Splits counterparties at the median value (in £m) and median volume.
+    Works on build_counterparty_metrics or summarise_counterparties output;
+    returns counterparty, role, value_total, volume_total, quadrant sorted by value.
+
+    thresholds={"value_total": ..., "volume_total": ...} replaces the medians
+    of `metrics` with given cut-offs: numbers (value in £) or quantile
+    sketches (their median), e.g. merged sketches.sketch_columns of every
+    partition, so each partition can be classified on its own.
+    """
+    value_m = metrics["value_total"].to_numpy(dtype=float) / 1e6
+    volume = metrics["volume_total"].to_numpy(dtype=float)
+    if thresholds is None:
+        v_med = float(np.nanmedian(value_m)) if len(value_m) else np.nan
+        q_med = float(np.nanmedian(volume)) if len(volume) else np.nan
+    else:
+        v_med = threshold(thresholds["value_total"]) / 1e6
+        q_med = threshold(thresholds["volume_total"])
+
+    # NaN compares False on both sides, so it lands in the last quadrant as before
+    high_v, low_v = value_m >= v_med, value_m < v_med
+    high_q, low_q = volume >= q_med, volume < q_med
+    quadrant = np.select([high_v & high_q, low_v & high_q, high_v & low_q], QUADRANTS[:3], QUADRANTS[3])
+
+    cols = ["counterparty", "role", "value_total", "volume_total"]
+    out = metrics[cols].assign(quadrant=quadrant)
+    return out.sort_values(by=["value_total"], ascending=False)
@@ -0,0 +1,234 @@
+"""
+Out-of-core execution of the network and counterparty aggregations with
+DuckDB (optional dependency: pip install duckdb).
+
+build_flow_pairs, participant_metrics, build_counterparty_metrics and
+cleaning.aggregate_flows take backend="duckdb". Their input may then be a
+DataFrame or Parquet on disk (a file, a directory of partitions or a glob),
+which DuckDB scans lazily. Its hash aggregates spill to temp_directory when
+they outgrow memory_limit, so the inputs never have to fit in pandas:
+
+    outofcore.configure(memory_limit="8GB", temp_directory="/scratch/duckdb")
+    pairs = network.build_flow_pairs("history/transfers/", backend="duckdb")
+    participants = network.participant_metrics(pairs, backend="duckdb")
+
+Only the grouped results come back to pandas, and the finishing steps
+(profiles, role labels, the final sort) are the pandas path's own code.
+Rows, order and dtypes therefore match the pandas backend. Float totals
+are summed with DuckDB's compensated fsum, so they can differ from pandas
+in the last bits, as with the chunked pandas path.
+"""
+import os
+import sys
+import itertools
+import functools
+
+import numpy as np
+import pandas as pd
+
+BACKENDS = ("pandas", "duckdb")
+
+_STATE = {"connection": None, "settings": {}}
+_names = itertools.count()
+
+
+def check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+
+
+def configure(memory_limit=None, temp_directory=None, threads=None):
+    """
+    Settings for the shared DuckDB connection (memory_limit such as "4GB",
+    temp_directory for spilled data, threads). Takes effect on the next query.
+    """
+    settings = {"memory_limit": memory_limit, "temp_directory": temp_directory, "threads": threads}
+    _STATE["settings"] = {k: v for k, v in settings.items() if v is not None}
+    _STATE["connection"] = None
+
+
+def connection():
+    """
+    The shared in-process DuckDB connection, created on first use.
+    """
+    if _STATE["connection"] is None:
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("backend='duckdb' needs the duckdb package (pip install duckdb)") from e
+        con = duckdb.connect()
+        for key, value in _STATE["settings"].items():
+            con.execute(f"SET {key} = '{value}'" if isinstance(value, str) else f"SET {key} = {value}")
+        _STATE["connection"] = con
+    return _STATE["connection"]
+
+
+@functools.lru_cache(maxsize=1)
+def _whitespace():
+    # Characters str.strip() removes, so names are cleaned exactly as in pandas
+    return "".join(c for c in map(chr, range(sys.maxunicode + 1)) if c.isspace())
+
+
+def _view(con, source, columns):
+    """
+    Registers `source` (DataFrame or Parquet path / directory / glob / list
+    of paths) with DuckDB and returns its name. DataFrames are scanned in
+    place; Parquet is read lazily, partition by partition.
+    """
+    name = f"_fmfx_{next(_names)}"
+    if isinstance(source, pd.DataFrame):
+        missing = [c for c in columns if c not in source.columns]
+        if missing:
+            raise ValueError(f"Columns not found: {missing}")
+        con.register(name, source[list(columns)])
+        return name
+    if isinstance(source, (str, os.PathLike)):
+        paths = [os.fspath(source)]
+    elif isinstance(source, (list, tuple)) and all(isinstance(p, (str, os.PathLike)) for p in source):
+        paths = [os.fspath(p) for p in source]
+    else:
+        raise ValueError("backend='duckdb' takes a DataFrame or a Parquet path (file, directory or glob)")
+    paths = [os.path.join(p, "**", "*.parquet") if os.path.isdir(p) else p for p in paths]
+    rel = con.read_parquet(paths, hive_partitioning=True)
+    missing = [c for c in columns if c not in rel.columns]
+    if missing:
+        raise ValueError(f"Columns not found: {missing}")
+    rel.create_view(name, replace=False)
+    return name
+
+
+def _query(source, columns, sql, params=(), extra=None):
+    # `sql` refers to the source view as {src}; `extra` registers more frames
+    con = connection()
+    sources = {"src": source, **(extra or {})}
+    names = {}
+    try:
+        for key, frame in sources.items():
+            names[key] = _view(con, frame, columns if key == "src" else list(frame.columns))
+        return con.execute(sql.format(**names), list(params)).df()
+    finally:
+        for key, name in names.items():
+            if isinstance(sources[key], pd.DataFrame):
+                con.unregister(name)
+            else:
+                con.execute(f"DROP VIEW {name}")
+
+
+def _like(values):
+    """
+    Nullable integer keys as pandas reads them from Parquet: int64, or
+    float64 when some are missing.
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and values.dtype.kind in "iu":
+        return values.astype(float if values.isna().any() else np.int64)
+    return values
+
+
+def cast_like(out, template):
+    """
+    `out` with the column dtypes of `template` (the pandas path's result on
+    an empty frame), so both backends return the same dtypes.
+    """
+    return out.astype(dict(template.dtypes))
+
+
+def flow_pairs(transfers, accounts=None):
+    """
+    build_flow_pairs over `transfers`; `accounts` is an optional
+    (account_id, client_id) frame rolling both ends up to clients.
+    """
+    cols = ["sender_account_id", "recipient_account_id", "transfer_id", "normalised_amount"]
+    if accounts is None:
+        sql = """
+            SELECT sender_account_id AS source_id, recipient_account_id AS destination_id,
+                   count(transfer_id) AS transfer_count, coalesce(fsum(normalised_amount), 0) AS total_value
+            FROM {src}
+            GROUP BY ALL
+            ORDER BY source_id NULLS LAST, destination_id NULLS LAST
+        """
+        out = _query(transfers, cols, sql)
+        out["source_id"] = _like(out["source_id"])
+        out["destination_id"] = _like(out["destination_id"])
+    else:
+        sql = """
+            SELECT s.client_id AS source_id, r.client_id AS destination_id,
+                   count(t.transfer_id) AS transfer_count, coalesce(fsum(t.normalised_amount), 0) AS total_value
+            FROM {src} t
+            JOIN {acc} s ON t.sender_account_id = s.account_id
+            JOIN {acc} r ON t.recipient_account_id = r.account_id
+            GROUP BY ALL
+            ORDER BY source_id, destination_id
+        """
+        out = _query(transfers, cols, sql, extra={"acc": accounts})
+        out[["source_id", "destination_id"]] = out[["source_id", "destination_id"]].astype(np.int64)
+    out["transfer_count"] = out["transfer_count"].astype(np.int64)
+    out["total_value"] = out["total_value"].astype(float)
+    return out
+
+
+def participant_parts(flow_pairs):
+    """
+    The grouped pieces of participant_metrics: (unique_destinations,
+    unique_sources, total_sent, total_received) Series by participant id,
+    sorted by id, and the ids taking part in a two-way corridor.
+    """
+    cols = ["source_id", "destination_id", "transfer_count", "total_value"]
+    sql = """
+        SELECT {key} AS id, count(DISTINCT {other}) AS n, coalesce(fsum(total_value), 0) AS v
+        FROM {{src}}
+        WHERE {key} IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+    """
+    parts = []
+    for key, other, n_name, v_name in (("source_id", "destination_id", "unique_destinations", "total_sent"),
+                                       ("destination_id", "source_id", "unique_sources", "total_received")):
+        g = _query(flow_pairs, cols, sql.format(key=key, other=other))
+        index = pd.Index(_like(g["id"]))
+        parts.append(pd.Series(g["n"].astype(np.int64).to_numpy(), index=index, name=n_name))
+        parts.append(pd.Series(g["v"].astype(float).to_numpy(), index=index, name=v_name))
+    unique_dest, sent, unique_src, received = parts
+
+    two_way = _query(flow_pairs, cols, """
+        SELECT DISTINCT a.source_id AS id
+        FROM {src} a JOIN {src} b ON a.source_id = b.destination_id AND a.destination_id = b.source_id
+    """)["id"]
+    return unique_dest, unique_src, sent, received, _like(two_way).to_numpy()
+
+
+def counterparty_totals(df, entity_col, amount_col):
+    """
+    (counterparty, value_total, volume_total) sorted by name, with names
+    cleaned as in network._counterparty_partials (missing/blank -> "Unknown").
+    """
+    sql = f"""
+        SELECT coalesce(nullif(trim(CAST("{entity_col}" AS VARCHAR), ?), ''), 'Unknown') AS counterparty,
+               fsum(coalesce(TRY_CAST("{amount_col}" AS DOUBLE), 0)) AS value_total,
+               count(*) AS volume_total
+        FROM {{src}}
+        GROUP BY 1
+        ORDER BY 1
+    """
+    out = _query(df, [entity_col, amount_col], sql, params=[_whitespace()])
+    out["counterparty"] = out["counterparty"].astype(str)
+    out["value_total"] = out["value_total"].astype(float)
+    out["volume_total"] = out["volume_total"].astype(np.int64)
+    return out
+
+
+def entity_totals(df, entity_col, amount_col):
+    """
+    Sum of `amount_col` per non-missing `entity_col`, sorted by entity (the
+    groupby in cleaning.aggregate_flows).
+    """
+    sql = f"""
+        SELECT "{entity_col}", coalesce(fsum("{amount_col}"), 0) AS "{amount_col}"
+        FROM {{src}}
+        WHERE "{entity_col}" IS NOT NULL
+        GROUP BY 1
+        ORDER BY 1
+    """
+    out = _query(df, [entity_col, amount_col], sql)
+    out[amount_col] = out[amount_col].astype(float)
+    return out
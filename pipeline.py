@@ -0,0 +1,390 @@
+"""
+Scriptable version of fmfx_solution.ipynb: load -> flow pairs / participants,
+client network -> plot, deposit / withdrawal name standardisation ->
+counterparty metrics -> quadrants.
+
+Each stage declares its input frames and the parameters it uses. A stage's
+key is a SHA-256 over its name, those parameter values, the keys of the
+stages it reads from, and the source of the modules it calls (with the
+modules they import, instrumentation and this file). The load stage is
+keyed by the workbook's content hash. Outputs are written to a
+Parquet cache with a small manifest. On the next run, a stage whose key
+is unchanged and whose outputs still exist is skipped. Independent
+branches (e.g. deposit and withdrawal cleaning) run concurrently with
+jobs > 1.
+
+    python pipeline.py --excel "data/Test for Data Science role.xlsx" --jobs 2
+    python pipeline.py --threshold 0.85 --max-nodes 150   # reruns only what depends on them
+    python pipeline.py --list
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import pandas as pd
+
+try:
+    from . import data_io, cleaning, network, viz, sketches, outofcore, instrumentation
+except ImportError:
+    import data_io, cleaning, network, viz, sketches, outofcore, instrumentation
+
+DEFAULT_PARAMS = {
+    "excel_path": os.path.join("data", "Test for Data Science role.xlsx"),
+    "threshold": 0.9,
+    "scorer": "difflib",
+    "method": "greedy",
+    "backend": "networkx",
+    "betweenness": "auto",
+    "seed": None,
+    "role_quantiles": [0.9, 0.6],
+    "max_nodes": 200,
+    "label_mode": "topk",
+    "label_by": "strength",
+    "topk_labels": 40,
+}
+
+
+class Stage:
+    """
+    One pipeline step: fn(inputs, params, output_dir) -> {output name: DataFrame}.
+    `files` are extra artefacts written under output_dir (checked for the skip).
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), params=(), modules=(), files=()):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.params = tuple(params)
+        self.modules = tuple(modules)
+        self.files = tuple(files)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={list(self.inputs)}, outputs={list(self.outputs)})"
+
+
+# --- stage functions -----------------------------------------------------
+
+def _load(inputs, params, output_dir):
+    return data_io.load_all_tables(params["excel_path"])
+
+
+def _flow_pairs(inputs, params, output_dir):
+    return {"flow_pairs": network.build_flow_pairs(inputs["transfers"])}
+
+
+def _participants(inputs, params, output_dir):
+    return {"participants": network.participant_metrics(inputs["flow_pairs"])}
+
+
+def _client_network(inputs, params, output_dir):
+    nodes_df, edges_df, _ = network.build_client_network(
+        inputs["client"], inputs["accounts"], inputs["transfers"],
+        backend=params["backend"], betweenness=params["betweenness"], seed=params["seed"],
+        role_quantiles=tuple(params["role_quantiles"]),
+    )
+    return {"nodes": nodes_df, "edges": edges_df}
+
+
+def _client_ledger(inputs, params, output_dir):
+    ledger = network.build_client_ledger(inputs["accounts"], inputs["deposits"], inputs["withdrawals"],
+                                         inputs["transfers"])
+    ledger.to_csv(os.path.join(output_dir, "client_ledger.csv"), index=False)
+    return {"client_ledger": ledger}
+
+
+def _network_plot(inputs, params, output_dir):
+    nodes_df, edges_df = inputs["nodes"], inputs["edges"]
+    G = network.SparseClientGraph.from_edges(edges_df, nodes_df["hub_spot_deal_id"].to_numpy())
+    viz.plot_network(G, nodes_df, os.path.join(output_dir, "client_network"),
+                     max_nodes=params["max_nodes"], label_mode=params["label_mode"],
+                     label_by=params["label_by"], topk_labels=params["topk_labels"])
+    return {}
+
+
+def _standardise(col, table):
+    def run(inputs, params, output_dir):
+        out = cleaning.standardise_counterparty_names(inputs[table], col=col, threshold=params["threshold"],
+                                                      scorer=params["scorer"], method=params["method"])
+        return {f"{table}_std": out}
+    return run
+
+
+def _counterparty_metrics(inputs, params, output_dir):
+    rem = network.summarise_counterparties(inputs["deposits_std"], "deposit_remitter_name_standardised",
+                                           "normalised_amount", "remitter")
+    ben = network.summarise_counterparties(inputs["withdrawals_std"], "beneficiary_name_standardised",
+                                           "normalised_amount", "beneficiary")
+    summary = pd.concat([rem, ben], ignore_index=True)
+    metrics_all = summary[["counterparty", "value_total", "volume_total", "role"]]
+    metrics_all.to_csv(os.path.join(output_dir, "counterparty_metrics.csv"))
+    return {"counterparty_summary": summary, "counterparty_metrics": metrics_all}
+
+
+def _quadrants(inputs, params, output_dir):
+    quads = network.classify_quadrants(inputs["counterparty_metrics"])
+    quads.to_csv(os.path.join(output_dir, "counterparty_quadrants.csv"), index=False)
+    return {"quadrants": quads}
+
+
+STAGES = [
+    Stage("load", _load, outputs=[s.lower() for s in data_io.SHEETS],
+          params=("excel_path",), modules=("data_io",)),
+    Stage("flow_pairs", _flow_pairs, inputs=("transfers",), outputs=("flow_pairs",), modules=("network",)),
+    Stage("participants", _participants, inputs=("flow_pairs",), outputs=("participants",), modules=("network",)),
+    Stage("client_network", _client_network, inputs=("client", "accounts", "transfers"),
+          outputs=("nodes", "edges"), params=("backend", "betweenness", "seed", "role_quantiles"),
+          modules=("network",)),
+    Stage("client_ledger", _client_ledger, inputs=("accounts", "deposits", "withdrawals", "transfers"),
+          outputs=("client_ledger",), modules=("network",), files=("client_ledger.csv",)),
+    Stage("network_plot", _network_plot, inputs=("nodes", "edges"),
+          params=("max_nodes", "label_mode", "label_by", "topk_labels"), modules=("network", "viz"),
+          files=("client_network_clean.png", "client_network_labeled.png")),
+    Stage("deposits_std", _standardise("deposit_remitter_name", "deposits"), inputs=("deposits",),
+          outputs=("deposits_std",), params=("threshold", "scorer", "method"), modules=("cleaning",)),
+    Stage("withdrawals_std", _standardise("beneficiary_name", "withdrawals"), inputs=("withdrawals",),
+          outputs=("withdrawals_std",), params=("threshold", "scorer", "method"), modules=("cleaning",)),
+    Stage("counterparty_metrics", _counterparty_metrics, inputs=("deposits_std", "withdrawals_std"),
+          outputs=("counterparty_summary", "counterparty_metrics"), modules=("network",),
+          files=("counterparty_metrics.csv",)),
+    Stage("quadrants", _quadrants, inputs=("counterparty_metrics",), outputs=("quadrants",),
+          modules=("network",), files=("counterparty_quadrants.csv",)),
+]
+
+
+# --- keys and cache ------------------------------------------------------
+
+def _producers(stages):
+    out = {}
+    for st in stages:
+        for name in st.outputs:
+            if name in out:
+                raise ValueError(f"Output {name!r} is produced by both {out[name].name!r} and {st.name!r}")
+            out[name] = st
+    return out
+
+
+def _upstream(stage, producers):
+    return list(dict.fromkeys(producers[name].name for name in stage.inputs))
+
+
+def _topological(stages):
+    producers = _producers(stages)
+    by_name = {st.name: st for st in stages}
+    order, seen = [], set()
+
+    def visit(st, path):
+        if st.name in seen:
+            return
+        if st.name in path:
+            raise ValueError(f"Cycle in pipeline at stage {st.name!r}")
+        for up in _upstream(st, producers):
+            visit(by_name[up], path | {st.name})
+        seen.add(st.name)
+        order.append(st)
+
+    for st in stages:
+        visit(st, frozenset())
+    return order
+
+
+def _file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+_MODULE_FILES = {"data_io": data_io, "cleaning": cleaning, "network": network, "viz": viz,
+                 "sketches": sketches, "outofcore": outofcore, "instrumentation": instrumentation,
+                 "pipeline": sys.modules[__name__]}
+
+# Modules imported by the ones a stage lists; every stage also runs this
+# file's stage functions under instrumentation
+_MODULE_DEPS = {"network": ("sketches", "outofcore"), "cleaning": ("outofcore",)}
+_ALWAYS = ("pipeline", "instrumentation")
+
+
+def _stage_modules(stage):
+    mods = list(_ALWAYS)
+    for m in stage.modules:
+        for dep in (m, *_MODULE_DEPS.get(m, ())):
+            if dep not in mods:
+                mods.append(dep)
+    return sorted(mods)
+
+
+def stage_keys(stages, params):
+    """
+    Content key per stage name (see module docstring).
+    """
+    producers = _producers(stages)
+    code = {m: _file_digest(mod.__file__) for m, mod in _MODULE_FILES.items()}
+    keys = {}
+    for st in _topological(stages):
+        payload = {
+            "stage": st.name,
+            "params": {p: params[p] for p in st.params},
+            "inputs": {name: keys[producers[name].name] for name in st.inputs},
+            "code": {m: code[m] for m in _stage_modules(st)},
+        }
+        if st.name == "load":
+            payload["source_sha256"] = _file_digest(params["excel_path"])
+        keys[st.name] = hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+    return keys
+
+
+def _output_path(cache_dir, name):
+    return os.path.join(cache_dir, f"{name}.parquet")
+
+
+def _manifest_path(cache_dir, stage_name):
+    return os.path.join(cache_dir, f"{stage_name}.manifest.json")
+
+
+def is_fresh(stage, key, cache_dir, output_dir):
+    """
+    True if the stage's manifest has this key and all its outputs exist.
+    """
+    path = _manifest_path(cache_dir, stage.name)
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        if json.load(f).get("key") != key:
+            return False
+    return (all(os.path.exists(_output_path(cache_dir, n)) for n in stage.outputs)
+            and all(os.path.exists(os.path.join(output_dir, f)) for f in stage.files))
+
+
+def _execute(stage_name, key, params, cache_dir, output_dir):
+    # Runs one stage (in a worker process when jobs > 1) and writes its cache entry
+    stage = {st.name: st for st in STAGES}[stage_name]
+    inputs = {name: pd.read_parquet(_output_path(cache_dir, name)) for name in stage.inputs}
+    t0 = time.perf_counter()
+    outputs = stage.fn(inputs, params, output_dir)
+    seconds = time.perf_counter() - t0
+    for name in stage.outputs:
+        tmp = _output_path(cache_dir, name) + ".tmp"
+        outputs[name].to_parquet(tmp, index=False)
+        os.replace(tmp, _output_path(cache_dir, name))
+    with open(_manifest_path(cache_dir, stage_name), "w") as f:
+        json.dump({"stage": stage_name, "key": key, "outputs": list(stage.outputs),
+                   "seconds": round(seconds, 3), "params": {p: params[p] for p in stage.params}}, f, indent=2)
+    return stage_name, seconds
+
+
+def run_pipeline(params=None, cache_dir=os.path.join(".cache", "pipeline"), output_dir="output",
+                 jobs=1, targets=None, force=(), verbose=True):
+    """
+    Runs the stages needed for `targets` (stage names; default all), skipping
+    fresh ones. force= lists stages to rerun regardless (their downstream
+    stages rerun too). With jobs > 1 ready
+    stages run concurrently in a process pool.
+    Returns {stage name: "cached" | "ran"}; outputs are read back with
+    read_output(name, cache_dir).
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    by_name = {st.name: st for st in STAGES}
+    unknown = set(targets or ()).union(force).difference(by_name)
+    if unknown:
+        raise ValueError(f"Unknown stages: {sorted(unknown)}")
+
+    producers = _producers(STAGES)
+    needed, todo = set(), list(targets or by_name)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(_upstream(by_name[name], producers))
+    order = [st for st in _topological(STAGES) if st.name in needed]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    keys = stage_keys(STAGES, params)
+
+    status, pending = {}, []
+    for st in order:
+        stale_upstream = any(up.name in _upstream(st, producers) for up in pending)
+        if st.name not in force and not stale_upstream and is_fresh(st, keys[st.name], cache_dir, output_dir):
+            status[st.name] = "cached"
+            if verbose:
+                print(f"[cached] {st.name}")
+        else:
+            pending.append(st)
+
+    def ready(st):
+        return all(status.get(up) for up in _upstream(st, producers) if up in needed)
+
+    def done(name, seconds):
+        status[name] = "ran"
+        if verbose:
+            print(f"[ran]    {name} ({seconds:.2f}s)")
+
+    if jobs <= 1:
+        for st in pending:
+            done(*_execute(st.name, keys[st.name], params, cache_dir, output_dir))
+        return status
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        running = {}
+        while pending or running:
+            for st in [s for s in pending if ready(s)]:
+                pending.remove(st)
+                running[pool.submit(_execute, st.name, keys[st.name], params, cache_dir, output_dir)] = st.name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                running.pop(fut)
+                done(*fut.result())
+    return status
+
+
+def read_output(name, cache_dir=os.path.join(".cache", "pipeline")):
+    """
+    A cached stage output (e.g. "nodes", "quadrants") as a DataFrame.
+    """
+    return pd.read_parquet(_output_path(cache_dir, name))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the FMFX analysis pipeline with cached stages.")
+    parser.add_argument("--excel", dest="excel_path", default=DEFAULT_PARAMS["excel_path"])
+    parser.add_argument("--cache-dir", default=os.path.join(".cache", "pipeline"))
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_PARAMS["threshold"])
+    parser.add_argument("--scorer", default=DEFAULT_PARAMS["scorer"])
+    parser.add_argument("--method", default=DEFAULT_PARAMS["method"])
+    parser.add_argument("--backend", default=DEFAULT_PARAMS["backend"])
+    parser.add_argument("--betweenness", default=DEFAULT_PARAMS["betweenness"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_PARAMS["seed"])
+    parser.add_argument("--role-quantiles", type=float, nargs=2, metavar=("Q_HI", "Q_MID"),
+                        default=DEFAULT_PARAMS["role_quantiles"])
+    parser.add_argument("--max-nodes", type=int, default=DEFAULT_PARAMS["max_nodes"])
+    parser.add_argument("--label-mode", default=DEFAULT_PARAMS["label_mode"])
+    parser.add_argument("--label-by", default=DEFAULT_PARAMS["label_by"])
+    parser.add_argument("--topk-labels", type=int, default=DEFAULT_PARAMS["topk_labels"])
+    parser.add_argument("--target", action="append", help="stage to build (repeatable; default all)")
+    parser.add_argument("--force", action="append", default=[], help="stage to rerun even if cached")
+    parser.add_argument("--list", action="store_true", help="list stages and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for st in _topological(STAGES):
+            print(f"{st.name:22s} inputs={list(st.inputs)} params={list(st.params)}")
+        return
+
+    import matplotlib
+    matplotlib.use("Agg")
+    params = {p: getattr(args, p) for p in DEFAULT_PARAMS}
+    params["role_quantiles"] = list(params["role_quantiles"])
+    run_pipeline(params, cache_dir=args.cache_dir, output_dir=args.output_dir, jobs=args.jobs,
+                 targets=args.target, force=args.force)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
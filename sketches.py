@@ -0,0 +1,211 @@
+"""
+Mergeable quantile sketches for thresholds on data that does not fit in
+one frame (chunked reads, per-worker partitions, per-period runs).
+
+KLLSketch (Karnin, Lang & Liberty, 2016) keeps O(k) items. Any quantile it
+returns has rank error within about `rank_error` (~1.5% at k=200) of the
+true one, with high probability; typical errors are nearer 0.2-0.3%.
+Sketches built on separate partitions merge into one with the same
+guarantee, so workers can each sketch their part, send the small sketches
+to one place and use the merged thresholds without shuffling the rows.
+
+    parts = [sketch_columns(chunk, ["value_total", "volume_total"]) for chunk in chunks]
+    merged = merge_sketches(parts)
+    network.classify_quadrants(chunk, thresholds=merged)   # per chunk, same cut-offs
+
+Until the first compaction (fewer than about k values), a sketch is exact.
+Its quantiles then equal pandas' linearly interpolated Series.quantile.
+"""
+import math
+
+import numpy as np
+
+_DEFAULT_K = 200
+_C = 2.0 / 3.0
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch over floats; NaN values are ignored.
+    update() takes scalars or arrays, merge() folds in another sketch in place.
+    """
+
+    def __init__(self, k=_DEFAULT_K, seed=None):
+        if k < 8:
+            raise ValueError("k must be at least 8")
+        self.k = int(k)
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.n
+
+    def __repr__(self):
+        return f"KLLSketch(k={self.k}, n={self.n}, retained={self.num_retained})"
+
+    @property
+    def num_retained(self):
+        return sum(len(level) for level in self._levels)
+
+    @property
+    def is_exact(self):
+        return len(self._levels) == 1
+
+    @property
+    def rank_error(self):
+        """
+        Approximate normalised rank error (DataSketches' empirical fit for
+        KLL at 99% confidence); 0 while the sketch is still exact.
+        """
+        return 0.0 if self.is_exact else 2.296 / self.k ** 0.9445
+
+    def _capacity(self, level):
+        depth = len(self._levels) - level - 1
+        return max(2, int(math.ceil(self.k * _C ** depth)))
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other):
+        """
+        Folds `other` into this sketch (other is left unchanged).
+        """
+        if other.n == 0:
+            return self
+        while len(self._levels) < len(other._levels):
+            self._levels.append(np.empty(0))
+        for h, items in enumerate(other._levels):
+            self._levels[h] = np.concatenate([self._levels[h], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        # Compact any level over its capacity: sort, keep every other item
+        # from a random offset at twice the weight one level up. An odd item
+        # out stays behind, so the total weight is always n.
+        h = 0
+        while h < len(self._levels):
+            level = self._levels[h]
+            if len(level) > self._capacity(h):
+                if h + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                level = np.sort(level)
+                rest = level[:1] if len(level) % 2 else level[:0]
+                level = level[len(rest):]
+                promoted = level[self._rng.integers(2)::2]
+                self._levels[h] = rest
+                self._levels[h + 1] = np.concatenate([self._levels[h + 1], promoted])
+                # capacities depend on the number of levels, so restart
+                h = 0
+                continue
+            h += 1
+
+    def _weighted(self):
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([np.full(len(lv), 2 ** h, dtype=np.int64) for h, lv in enumerate(self._levels)])
+        order = np.argsort(items, kind="stable")
+        return items[order], weights[order]
+
+    def quantile(self, q):
+        """
+        Value at quantile q (scalar or array in [0, 1]), interpolated
+        linearly between the weighted items like pandas' Series.quantile.
+        NaN for an empty sketch.
+        """
+        q_arr = np.asarray(q, dtype=float)
+        if np.any((q_arr < 0) | (q_arr > 1)):
+            raise ValueError("quantiles must be between 0 and 1")
+        if self.n == 0:
+            out = np.full(q_arr.shape, np.nan)
+        else:
+            items, weights = self._weighted()
+            cum = np.cumsum(weights)
+            pos = q_arr * (self.n - 1)
+            lo, hi = np.floor(pos), np.ceil(pos)
+            v_lo = items[np.searchsorted(cum, lo, side="right")]
+            v_hi = items[np.searchsorted(cum, hi, side="right")]
+            out = v_lo + (v_hi - v_lo) * (pos - lo)
+            out = np.clip(out, self.min, self.max)
+        return float(out) if out.ndim == 0 else out
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def rank(self, value):
+        """
+        Estimated fraction of values strictly below `value`.
+        """
+        if self.n == 0:
+            return np.nan
+        items, weights = self._weighted()
+        return float(weights[items < value].sum() / self.n)
+
+    def to_dict(self):
+        return {"k": self.k, "n": self.n, "min": self.min, "max": self.max,
+                "levels": [lv.tolist() for lv in self._levels]}
+
+    @classmethod
+    def from_dict(cls, data, seed=None):
+        sk = cls(data["k"], seed=seed)
+        sk.n, sk.min, sk.max = data["n"], data["min"], data["max"]
+        sk._levels = [np.asarray(lv, dtype=float) for lv in data["levels"]]
+        return sk
+
+
+def threshold(value, q=0.5):
+    """
+    A cut-off from a sketch (its q quantile) or a number passed through.
+    """
+    if hasattr(value, "quantile"):
+        return value.quantile(q)
+    return float(value)
+
+
+def sketch_columns(df, columns, by=None, k=_DEFAULT_K, seed=None):
+    """
+    {column: KLLSketch} for the given columns of `df`, or with `by` (a column
+    name or list, e.g. "role" or ["period", "role"]) {group key: {column: KLLSketch}}.
+    """
+    columns = [columns] if isinstance(columns, str) else list(columns)
+    missing = [c for c in columns if c not in df.columns]
+    if missing:
+        raise ValueError(f"Columns not found: {missing}")
+
+    def build(frame):
+        return {c: KLLSketch(k, seed=seed).update(frame[c].to_numpy(dtype=float)) for c in columns}
+
+    if by is None:
+        return build(df)
+    return {key: build(group) for key, group in df.groupby(by, sort=True, observed=True)}
+
+
+def merge_sketches(parts):
+    """
+    Merges sketch dicts as returned by sketch_columns (flat or grouped)
+    key by key into new sketches; the inputs are left unchanged.
+    """
+    merged = {}
+    for part in parts:
+        for key, value in part.items():
+            if isinstance(value, dict):
+                merged[key] = merge_sketches([merged.get(key, {}), value])
+            elif key in merged:
+                merged[key].merge(value)
+            else:
+                merged[key] = KLLSketch(value.k).merge(value)
+    return merged
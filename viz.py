@@ -1,11 +1,25 @@
+import os
 import math
+import hashlib
+from collections import OrderedDict
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.image import imsave
 import networkx as nx
 
+try:
+    from .instrumentation import instrumented, stage
+except ImportError:
+    from instrumentation import instrumented, stage
+
 
+@instrumented
 def bar_top_series(df: pd.DataFrame, label_col: str, value_col: str, top_n=15, title=""):
     top = df.head(top_n)
     plt.figure()
@@ -14,6 +28,247 @@ def bar_top_series(df: pd.DataFrame, label_col: str, value_col: str, top_n=15, t
     plt.tight_layout()
 
 
+LAYOUTS = ("spring", "forceatlas2", "multilevel")
+ROLE_TO_INT = {"Hub": 3, "Bridge": 2, "Connector": 1, "Peripheral": 0}
+
+# Positions by layout key (see _layout_key); re-renders of the same
+# subgraph with other labels reuse them
+_LAYOUT_CACHE = OrderedDict()
+_LAYOUT_CACHE_SIZE = 16
+
+
+def _edge_arrays(G):
+    """
+    (node ids, source positions, target positions, weights) in the order
+    networkx iterates G.nodes() / G.edges(), for an nx graph or a
+    SparseClientGraph (without converting it).
+    """
+    if hasattr(G, "to_networkx"):
+        order = np.argsort(G.src_pos, kind="stable")
+        return G.node_ids, G.src_pos[order], G.dst_pos[order], np.asarray(G.edge_weight, dtype=float)[order]
+    nodes = list(G.nodes())
+    index = pd.Index(nodes)
+    edges = list(G.edges(data="weight", default=0.0))
+    src = index.get_indexer([u for u, _, _ in edges])
+    dst = index.get_indexer([v for _, v, _ in edges])
+    w = np.array([float(x) for _, _, x in edges], dtype=float)
+    ids = np.asarray(nodes) if all(isinstance(x, (int, np.integer)) for x in nodes) else np.array(nodes, dtype=object)
+    return ids, src.astype(np.int64), dst.astype(np.int64), w
+
+
+def _layout_key(ids, src, dst, w, layout, seed):
+    h = hashlib.sha256(f"{layout}|{seed}|{len(ids)}".encode())
+    h.update(pd.util.hash_array(np.asarray(ids)).tobytes())
+    for arr in (src, dst, w):
+        h.update(np.ascontiguousarray(arr).tobytes())
+    return h.hexdigest()
+
+
+def _scatter_pairs(i, j, f, m):
+    # sum of +f on i and -f on j per node, as an (m, 2) array
+    return np.column_stack([
+        np.bincount(i, f[:, 0], m) - np.bincount(j, f[:, 0], m),
+        np.bincount(i, f[:, 1], m) - np.bincount(j, f[:, 1], m),
+    ])
+
+
+def _far_repulsion(pos, k, block=2048):
+    """
+    Repulsion from distant nodes, Barnes-Hut style with a single level: the
+    plane is cut into a grid and each node is pushed by every other occupied
+    cell's centre of mass (weighted by its node count). Pairs inside a node's
+    own cell are left to the exact short-range term.
+    """
+    m = len(pos)
+    cells = int(np.clip(math.sqrt(m) / 3, 4, 24))
+    lo = pos.min(axis=0)
+    span = max(float(np.ptp(pos, axis=0).max()), 1e-9)
+    xy = np.minimum(((pos - lo) / span * cells).astype(int), cells - 1)
+    cell = xy[:, 0] * cells + xy[:, 1]
+    mass = np.bincount(cell, minlength=cells * cells)
+    occupied = np.flatnonzero(mass)
+    com = np.column_stack([np.bincount(cell, pos[:, 0], cells * cells),
+                           np.bincount(cell, pos[:, 1], cells * cells)])[occupied] / mass[occupied, None]
+    own = np.searchsorted(occupied, cell)
+    out = np.empty_like(pos)
+    for start in range(0, m, block):
+        stop = min(start + block, m)
+        delta = pos[start:stop, None, :] - com[None, :, :]
+        f = mass[occupied][None, :] * (k * k) / np.maximum((delta ** 2).sum(axis=2), 1e-18)
+        f[np.arange(stop - start), own[start:stop]] = 0.0
+        out[start:stop] = (f[:, :, None] * delta).sum(axis=1)
+    return out
+
+
+def _multilevel_layout(n, src, dst, w, seed=42, iterations=40, coarsest=60, neighbours=8, gravity=1.0):
+    """
+    Force-directed layout that scales to 10k+ nodes: the graph is coarsened
+    by heavy-edge matching (leftover nodes join their heaviest neighbour)
+    down to ~`coarsest` nodes, laid out there, then positions are carried
+    back level by level and refined with Fruchterman-Reingold forces. Instead
+    of all n^2 pairs, repulsion is exact for each node's `neighbours` nearest
+    nodes (k-d tree) and approximated by grid cells further out
+    (_far_repulsion). Returns an (n, 2) array scaled to [-1, 1].
+    """
+    from scipy import sparse
+    from scipy.spatial import cKDTree
+
+    rng = np.random.default_rng(seed)
+    keep = src != dst
+    ew = np.log1p(np.maximum(w[keep], 0)) + 1.0
+    A = sparse.coo_matrix((ew, (src[keep], dst[keep])), shape=(n, n)).tocsr()
+    A = (A + A.T).tocsr()
+
+    # Coarsen: each level maps nodes to clusters of the next
+    graphs, maps = [A], []
+    while graphs[-1].shape[0] > coarsest:
+        G = graphs[-1]
+        m = G.shape[0]
+        cluster = np.full(m, -1)
+        nxt = 0
+        for i in rng.permutation(m):
+            if cluster[i] >= 0:
+                continue
+            row = slice(G.indptr[i], G.indptr[i + 1])
+            nbrs, wts = G.indices[row], G.data[row]
+            free = cluster[nbrs] < 0
+            cluster[i] = nxt
+            if free.any():
+                cluster[nbrs[free][np.argmax(wts[free])]] = nxt
+            nxt += 1
+        # Singletons with neighbours join the heaviest neighbour's cluster
+        sizes = np.bincount(cluster, minlength=nxt)
+        for i in np.flatnonzero(sizes[cluster] == 1):
+            row = slice(G.indptr[i], G.indptr[i + 1])
+            if G.indptr[i + 1] > G.indptr[i]:
+                cluster[i] = cluster[G.indices[row][np.argmax(G.data[row])]]
+        _, cluster = np.unique(cluster, return_inverse=True)
+        k = cluster.max() + 1
+        if k > 0.9 * m:
+            break
+        P = sparse.csr_matrix((np.ones(m), (np.arange(m), cluster)), shape=(m, k))
+        C = (P.T @ G @ P).tocsr()
+        C.setdiag(0)
+        C.eliminate_zeros()
+        graphs.append(C)
+        maps.append(cluster)
+
+    def refine(G, pos, iters, t0):
+        m = G.shape[0]
+        k = math.sqrt(1.0 / m)
+        coo = G.tocoo()
+        upper = coo.row < coo.col
+        r, c, wt = coo.row[upper], coo.col[upper], coo.data[upper]
+        wt = wt / wt.mean() if len(wt) else wt
+        for it in range(iters):
+            disp = _far_repulsion(pos, k)
+            if m > 1:
+                nearest = cKDTree(pos).query(pos, k=min(neighbours + 1, m))[1][:, 1:]
+                delta = pos[:, None, :] - pos[nearest]
+                dist2 = np.maximum((delta ** 2).sum(axis=2), 1e-18)
+                disp += ((k * k / dist2)[:, :, None] * delta).sum(axis=1)
+            if len(r):
+                delta = pos[r] - pos[c]
+                dist = np.hypot(delta[:, 0], delta[:, 1])
+                disp -= _scatter_pairs(r, c, (wt * dist / k)[:, None] * delta, m)
+            disp -= gravity * k * (pos - pos.mean(axis=0))  # keeps disconnected components close
+            length = np.maximum(np.hypot(disp[:, 0], disp[:, 1]), 1e-9)
+            t = t0 * (1 - it / iters) + 1e-3 * k
+            pos = pos + disp / length[:, None] * np.minimum(length, t)[:, None]
+        return pos
+
+    coarse = graphs[-1]
+    pos = rng.uniform(0, 1, (coarse.shape[0], 2))
+    pos = refine(coarse, pos, iterations * 3, 0.1)
+    for level in range(len(maps) - 1, -1, -1):
+        G = graphs[level]
+        k = math.sqrt(1.0 / G.shape[0])
+        pos = pos[maps[level]] + rng.normal(0, 0.1 * k, (G.shape[0], 2))
+        pos = refine(G, pos, iterations, 2 * k)
+
+    pos = pos - pos.mean(axis=0)
+    lim = np.abs(pos).max()
+    return pos / lim if lim > 0 else pos
+
+
+def _layout(ids, src, dst, w, layout, seed, cache_dir=None):
+    """
+    (n, 2) positions for the subgraph given as arrays; cached in memory and,
+    with cache_dir, as <key>.npy files there.
+    """
+    key = _layout_key(ids, src, dst, w, layout, seed)
+    if key in _LAYOUT_CACHE:
+        _LAYOUT_CACHE.move_to_end(key)
+        return _LAYOUT_CACHE[key]
+    path = os.path.join(cache_dir, f"{key}.npy") if cache_dir else None
+    if path and os.path.exists(path):
+        pos = np.load(path)
+    else:
+        n = len(ids)
+        if layout == "multilevel":
+            pos = _multilevel_layout(n, src, dst, w, seed=seed)
+        else:
+            H = nx.DiGraph()
+            H.add_nodes_from(range(n))
+            H.add_weighted_edges_from(zip(src.tolist(), dst.tolist(), w.tolist()))
+            if layout == "forceatlas2":
+                p = nx.forceatlas2_layout(H, seed=seed, weight="weight")
+            else:
+                p = nx.spring_layout(H, k=0.85 / math.sqrt(n + 1), seed=seed, weight="weight")
+            pos = np.array([p[i] for i in range(n)], dtype=float)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(path, pos)
+    _LAYOUT_CACHE[key] = pos
+    while len(_LAYOUT_CACHE) > _LAYOUT_CACHE_SIZE:
+        _LAYOUT_CACHE.popitem(last=False)
+    return pos
+
+
+def _role_legend():
+    return [mpatches.Patch(color=plt.cm.viridis(v / 3), label=role) for role, v in ROLE_TO_INT.items()]
+
+
+def _label_text(ids, id_indexed):
+    # company_name, falling back to the id when missing or blank
+    if "company_name" not in id_indexed.columns:
+        return [str(n) for n in ids]
+    names = id_indexed["company_name"].reindex(ids)
+    return [str(name) if (pd.notna(name) and str(name).strip()) else str(n) for n, name in zip(ids, names)]
+
+
+def _add_labels(ax, xy_labels, labels):
+    for (x, y), lbl in zip(xy_labels, labels):
+        ax.text(x, y, lbl, fontsize=7, ha="center", va="center", color="#111111",
+                bbox=dict(boxstyle="round,pad=0.15", fc="white", ec="none", alpha=0.7))
+
+
+def _render_fast(xy, src, dst, widths, sizes, colors, label_xy, labels, clean_png, labeled_png):
+    # Edges, nodes and legend are rasterised once; the labeled image is
+    # that canvas restored with only the text layer drawn on top
+    fig = Figure(figsize=(12, 9), dpi=220)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    segments = np.stack([xy[src], xy[dst]], axis=1)
+    ax.add_collection(LineCollection(segments, linewidths=widths, colors="k", alpha=0.20, zorder=1))
+    ax.scatter(xy[:, 0], xy[:, 1], s=sizes, c=colors, cmap="viridis", vmin=0, vmax=3,
+               linewidths=0.5, edgecolors="#333333", alpha=0.95, zorder=2)
+    ax.legend(handles=_role_legend(), title="Network role", loc="lower left", frameon=False)
+    ax.autoscale_view()
+    ax.axis("off")
+    fig.tight_layout()
+    canvas.draw()
+    base = canvas.copy_from_bbox(fig.bbox)
+    imsave(clean_png, np.asarray(canvas.buffer_rgba()), dpi=220)
+
+    _add_labels(ax, label_xy, labels)
+    canvas.restore_region(base)
+    for text in ax.texts:
+        ax.draw_artist(text)
+    imsave(labeled_png, np.asarray(canvas.buffer_rgba()), dpi=220)
+
+
+@instrumented
 def plot_network(
     G: nx.DiGraph,
     nodes_df: pd.DataFrame,
@@ -23,6 +278,9 @@ def plot_network(
     label_by: str = "strength",       # "strength" | "betweenness"
     topk_labels: int = 30,
     seed: int = 42,
+    fast: bool = False,
+    layout: str = "spring",           # "spring" | "forceatlas2" | "multilevel"
+    layout_cache: str = None,
 ):
     """
     Visualise client-to-client transfers:
@@ -30,118 +288,230 @@ def plot_network(
       - node color ~ NetworkRole (Hub / Bridge / Connector / Peripheral)
       - edge width ~ transfer amount (log-scaled for readability)
       - labels = company_name (fallback -> client_id)
-    
+
+    The top `max_nodes` nodes by degree + log(1 + strength) are drawn
+    (max_nodes=None draws all). Their layout is computed once and kept in
+    memory (and under `layout_cache` if given) keyed by a hash of the
+    subgraph, so re-plotting with other labels skips it. layout="multilevel"
+    is a coarsen-and-refine force layout for 10k+ nodes.
+
+    fast=True draws the edges as one LineCollection and the nodes as one
+    scatter on a single canvas, saves it, then adds only the text layer for
+    the labeled version; a SparseClientGraph is used without converting it.
+
     Saves:
       - f"{out_path_base}_clean.png"
       - f"{out_path_base}_labeled.png"
     """
-    if G.number_of_nodes() == 0:
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}; expected one of {LAYOUTS}")
+    if not fast and hasattr(G, "to_networkx"):
+        # SparseClientGraph from build_client_network(..., backend="sparse")
+        G = G.to_networkx()
+
+    ids, src, dst, w = _edge_arrays(G)
+    if len(ids) == 0:
         print("Graph is empty; skipping plot.")
         return
 
     # --- Score nodes for subgraph selection
     # strength = total in+out amount
     id_indexed = nodes_df.set_index("hub_spot_deal_id")
-    node_strength = (id_indexed["in_strength"].fillna(0) + id_indexed["out_strength"].fillna(0)).to_dict()
-    node_betw = id_indexed["betweenness"].fillna(0).to_dict()
+    id_indexed = id_indexed[~id_indexed.index.duplicated(keep="last")]
+    strength = (id_indexed["in_strength"].fillna(0) + id_indexed["out_strength"].fillna(0)).reindex(ids).fillna(0).to_numpy()
+    betw = id_indexed["betweenness"].fillna(0).reindex(ids).fillna(0).to_numpy()
 
     # degree + log(1+strength) to prioritise visible structure
-    ranking_score = {
-        n: (G.in_degree(n) + G.out_degree(n)) + (math.log1p(node_strength.get(n, 0)) if node_strength.get(n, 0) > 0 else 0.0)
-        for n in G.nodes()
-    }
-    keep = [n for n, _ in sorted(ranking_score.items(), key=lambda kv: kv[1], reverse=True)[:max_nodes]]
-    H = G.subgraph(keep).copy()
+    n = len(ids)
+    degree = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+    ranking_score = degree + np.where(strength > 0, np.log1p(np.maximum(strength, 0)), 0.0)
+    top = np.argsort(-ranking_score, kind="stable")[:max_nodes]
+    kept = np.zeros(n, dtype=bool)
+    kept[top] = True
+
+    # Subgraph in G's node / edge order
+    sub = np.flatnonzero(kept)
+    remap = np.full(n, -1)
+    remap[sub] = np.arange(len(sub))
+    e_keep = kept[src] & kept[dst]
+    h_ids, h_src, h_dst, h_w = ids[sub], remap[src[e_keep]], remap[dst[e_keep]], w[e_keep]
 
     # --- Node visuals
-    strength_vec = np.array([node_strength.get(n, 0.0) for n in H.nodes()])
+    strength_vec = strength[sub]
     size_vec = 120 + 24 * np.log1p(np.maximum(strength_vec, 0))  # px
 
     # Color by NetworkRole
-    role_series = id_indexed["network_role"].reindex(list(H.nodes())).fillna("Peripheral")
-    role_to_int = {"Hub":3, "Bridge":2, "Connector":1, "Peripheral":0}
-    color_vec = role_series.map(role_to_int).fillna(0).to_numpy()
+    role_series = id_indexed["network_role"].reindex(h_ids).fillna("Peripheral")
+    color_vec = role_series.map(ROLE_TO_INT).fillna(0).to_numpy()
 
     # --- Edge visuals (width by amount, log-scaled)
-    widths = []
-    for u, v, d in H.edges(data=True):
-        w = float(d.get("weight", 0.0))
-        widths.append(0.4 + 1.6 * math.log1p(max(w, 0)))  # linewidth
+    widths = 0.4 + 1.6 * np.log1p(np.maximum(h_w, 0))  # linewidth
 
     # --- Layout
-    pos = nx.spring_layout(H, k=0.85 / math.sqrt(len(H.nodes()) + 1), seed=seed, weight="weight")
-
-    # Helper: common draw routine
-    def _draw(label_nodes=None, file_suffix="_clean"):
-        plt.figure(figsize=(12, 9), dpi=180)
-        nx.draw_networkx_edges(H, pos, alpha=0.20, width=widths, arrows=False)
-        nodes = nx.draw_networkx_nodes(
-            H, pos,
-            node_size=size_vec,
-            node_color=color_vec,
-            cmap="viridis",
-            linewidths=0.5,
-            edgecolors="#333333",
-            alpha=0.95,
-        )
-
-        # Legend for roles
-        patches = [
-            mpatches.Patch(color=plt.cm.viridis(role_to_int["Hub"]/3), label="Hub"),
-            mpatches.Patch(color=plt.cm.viridis(role_to_int["Bridge"]/3), label="Bridge"),
-            mpatches.Patch(color=plt.cm.viridis(role_to_int["Connector"]/3), label="Connector"),
-            mpatches.Patch(color=plt.cm.viridis(role_to_int["Peripheral"]/3), label="Peripheral"),
-        ]
-        plt.legend(handles=patches, title="Network role", loc="lower left", frameon=False)
-
-        # Labels (company_name -> fallback to id)
-        if label_nodes:
-            to_label = []
-            for n in label_nodes:
-                name = id_indexed.loc[n, "company_name"] if ("company_name" in id_indexed.columns and n in id_indexed.index) else None
-                lbl = str(name) if (pd.notna(name) and str(name).strip()) else str(n)
-                to_label.append((n, lbl))
-
-            # Draw labels
-            for n, lbl in to_label:
-                x, y = pos[n]
-                plt.text(x, y, lbl[:28], fontsize=7, ha="center", va="center", color="#111111",
-                         bbox=dict(boxstyle="round,pad=0.15", fc="white", ec="none", alpha=0.7))
-
-        plt.axis("off")
-        plt.tight_layout()
-        outfile = f"{out_path_base}{file_suffix}.png"
-        plt.savefig(outfile, dpi=220)
-        plt.close()
-        return outfile
-
-    # --- Decide which nodes to label
-    label_nodes = []
-    if label_mode.lower() == "none":
-        label_nodes = []
-    elif label_mode.lower() == "all":
-        label_nodes = list(H.nodes())
+    with stage("plot_network.layout"):
+        xy = _layout(h_ids, h_src, h_dst, h_w, layout, seed, layout_cache)
+
+    # --- Decide which nodes to label (positions within the subgraph)
+    mode = label_mode.lower()
+    if mode == "none":
+        label_pos = np.array([], dtype=int)
+    elif mode == "all":
+        label_pos = np.arange(len(sub))
     else:
-        if label_by == "betweenness":
-            scores = node_betw
-        else:
-            scores = node_strength
-        ranked = sorted(H.nodes(), key=lambda n: (scores.get(n, 0), ranking_score.get(n, 0)), reverse=True)
-        if label_mode.lower() == "topk":
-            label_nodes = ranked[:topk_labels]
-        elif label_mode.lower() == "auto":
+        scores = betw[sub] if label_by == "betweenness" else strength_vec
+        ranked = np.lexsort((-ranking_score[sub], -scores))
+        if mode == "auto":
             # Heuristic: more labels if graph is small, fewer if large
-            k = min(topk_labels, max(10, int(len(H.nodes()) * 0.15)))
-            label_nodes = ranked[:k]
+            ranked = ranked[:min(topk_labels, max(10, int(len(sub) * 0.15)))]
         else:
-            label_nodes = ranked[:topk_labels]
+            ranked = ranked[:topk_labels]
+        label_pos = ranked
+    labels = [lbl[:28] for lbl in _label_text(h_ids[label_pos], id_indexed)]
+
+    clean_png = f"{out_path_base}_clean.png"
+    labeled_png = f"{out_path_base}_labeled.png"
+
+    if fast:
+        with stage("plot_network.render"):
+            _render_fast(xy, h_src, h_dst, widths, size_vec, color_vec, xy[label_pos], labels,
+                         clean_png, labeled_png)
+    else:
+        H = nx.DiGraph()
+        H.add_nodes_from(h_ids.tolist())
+        H.add_edges_from(zip(h_ids[h_src].tolist(), h_ids[h_dst].tolist()))
+        pos = dict(zip(h_ids.tolist(), xy))
+
+        # Helper: common draw routine
+        def _draw(with_labels, outfile):
+            plt.figure(figsize=(12, 9), dpi=180)
+            nx.draw_networkx_edges(H, pos, alpha=0.20, width=list(widths), arrows=False)
+            nx.draw_networkx_nodes(
+                H, pos,
+                node_size=size_vec,
+                node_color=color_vec,
+                cmap="viridis",
+                linewidths=0.5,
+                edgecolors="#333333",
+                alpha=0.95,
+            )
+
+            # Legend for roles
+            plt.legend(handles=_role_legend(), title="Network role", loc="lower left", frameon=False)
+
+            # Labels (company_name -> fallback to id)
+            if with_labels:
+                _add_labels(plt.gca(), xy[label_pos], labels)
+
+            plt.axis("off")
+            plt.tight_layout()
+            plt.savefig(outfile, dpi=220)
+            plt.close()
+
+        # --- Render two versions
+        _draw(False, clean_png)
+        _draw(len(label_pos) > 0, labeled_png)
+
+    print("Saved:", clean_png)
+    print("Saved:", labeled_png)
+    return clean_png, labeled_png
+
+@instrumented
+def plot_network_aggregated(
+    super_nodes: pd.DataFrame,
+    super_edges: pd.DataFrame,
+    out_path_base: str,
+    layout: str = "spring",
+    topk_labels: int = 40,
+    backbone: int = 3,
+    seed: int = 42,
+    layout_cache: str = None,
+):
+    """
+    Draws network.aggregate_network's supernodes with the fast renderer:
+      - node size ~ total strength (in+out between groups plus internal)
+      - node color ~ the group's dominant NetworkRole
+      - edge width ~ summed transfer amount (log-scaled to 0.5-6 px)
+      - labels = group (client count) for the `topk_labels` largest groups
+    Groups usually trade with most other groups, so only each group's
+    `backbone` largest links (by amount, either direction) are laid out and
+    drawn; backbone=None keeps every link. The layout is cached like plot_network's. Saves
+    f"{out_path_base}_clean.png" and f"{out_path_base}_labeled.png".
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout {layout!r}; expected one of {LAYOUTS}")
+    if super_nodes.empty:
+        print("No supernodes; skipping plot.")
+        return
+
+    ids = super_nodes["group"].astype(str).to_numpy(dtype=object)
+    index = pd.Index(ids)
+    src = index.get_indexer(super_edges["sender_group"].astype(str)).astype(np.int64)
+    dst = index.get_indexer(super_edges["recipient_group"].astype(str)).astype(np.int64)
+    w = super_edges["edge_amount"].astype(float).to_numpy()
+    if backbone is not None and len(w):
+        # rank each link within both of its endpoints; keep it if it is in either's top `backbone`
+        ends = pd.DataFrame({"node": np.concatenate([src, dst]), "w": np.concatenate([w, w]),
+                             "edge": np.tile(np.arange(len(w)), 2)})
+        rank = ends.groupby("node")["w"].rank(method="first", ascending=False)
+        keep = np.zeros(len(w), dtype=bool)
+        keep[ends["edge"].to_numpy()[rank.to_numpy() <= backbone]] = True
+        src, dst, w = src[keep], dst[keep], w[keep]
+
+    strength = (super_nodes["in_strength"] + super_nodes["out_strength"] + super_nodes["internal_amount"]).to_numpy(dtype=float)
+    sizes = 120 + 24 * np.log1p(np.maximum(strength, 0))
+    roles = super_nodes["dominant_role"] if "dominant_role" in super_nodes.columns else pd.Series("Peripheral", index=super_nodes.index)
+    colors = roles.map(ROLE_TO_INT).fillna(0).to_numpy()
+    # group totals are all large, so spread the log amounts over 0.5-6 px
+    log_w = np.log1p(np.maximum(w, 0))
+    span = np.ptp(log_w) if len(log_w) else 0.0
+    widths = 0.5 + 5.5 * ((log_w - log_w.min()) / span if span > 0 else np.zeros_like(log_w))
 
-    # --- Render two versions
-    clean_png = _draw(label_nodes=[], file_suffix="_clean")
-    labeled_png = _draw(label_nodes=label_nodes, file_suffix="_labeled")
+    with stage("plot_network_aggregated.layout"):
+        # group totals span many orders of magnitude; lay out on log weights
+        xy = _layout(ids, src, dst, np.log1p(np.maximum(w, 0)), layout, seed, layout_cache)
 
+    label_pos = np.argsort(-super_nodes["n_clients"].to_numpy(), kind="stable")[:topk_labels]
+    labels = [f"{ids[i][:24]} ({n})" for i, n in zip(label_pos, super_nodes["n_clients"].to_numpy()[label_pos])]
+
+    clean_png = f"{out_path_base}_clean.png"
+    labeled_png = f"{out_path_base}_labeled.png"
+    with stage("plot_network_aggregated.render"):
+        _render_fast(xy, src, dst, widths, sizes, colors, xy[label_pos], labels, clean_png, labeled_png)
     print("Saved:", clean_png)
     print("Saved:", labeled_png)
+    return clean_png, labeled_png
+
+
+@instrumented
+def plot_supernode(
+    nodes_df: pd.DataFrame,
+    edges_df: pd.DataFrame,
+    membership: pd.Series,
+    group,
+    out_path_base: str,
+    **kwargs,
+):
+    """
+    Drill-down for one supernode: plot_network (fast mode, all members by
+    default) on the clients in `group` and the transfers among them. Only
+    that subgraph is laid out, and its layout is cached on its own.
+    kwargs go to plot_network.
+    """
+    try:
+        from .network import SparseClientGraph
+    except ImportError:
+        from network import SparseClientGraph
+
+    members = membership.index[membership.eq(group).to_numpy()]
+    if len(members) == 0:
+        raise ValueError(f"Unknown group {group!r}")
+    sub_nodes = nodes_df[nodes_df["hub_spot_deal_id"].isin(members)]
+    inside = (edges_df["sender_client"].astype("int64").isin(members)
+              & edges_df["recipient_client"].astype("int64").isin(members))
+    G = SparseClientGraph.from_edges(edges_df[inside], sub_nodes["hub_spot_deal_id"].to_numpy())
+    kwargs.setdefault("fast", True)
+    kwargs.setdefault("max_nodes", None)
+    return plot_network(G, sub_nodes, out_path_base, **kwargs)
 
 # def plot_network(flow_pairs: pd.DataFrame, title = "Directional flow of traffic"):
 #     """